@@ -0,0 +1,140 @@
+import datetime  # 投稿日時を日付ごとに集計するためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import os  # ファイルを扱うためのライブラリ
+import threading  # 複数スレッドからの同時更新に備えるためのライブラリ
+from typing import Any, Dict, Iterator, List, Optional, Set
+from mattermost_api import PER_PAGE, MattermostClient  # 共有の Mattermost API クライアント
+
+# since を指定した投稿の取得で、サーバーが一度に返す件数の上限です。
+# 上限に達した場合は取りこぼしがないよう、新しい順のページ単位の取得に切り替えます。
+SINCE_LIMIT = 1000
+
+
+def _day(create_at: int) -> str:
+    return datetime.datetime.fromtimestamp(create_at / 1000.0).date().isoformat()
+
+
+class ActivityStats:
+    """チャンネルごとの投稿数と投稿者数を、前回の続きから集計して保存します。
+
+    チャンネルごとに取得済みの最新の投稿日時（since）を保持し、次回はそれより新しい投稿だけを
+    since を指定して取得します。投稿は本文を保持せず、日付ごとの投稿数と、ユーザーごとの
+    (投稿数, 最新の投稿日時) のカウンターに加えるだけです。
+    システムメッセージと削除済みの投稿は数えません。
+
+    初回は全期間の投稿を取得します。backfill_days を指定すると、初回はその日数分に限ります。
+    """
+
+    def __init__(self, path: str, backfill_days: Optional[int] = None) -> None:
+        self.path = path
+        self.backfill_days = backfill_days
+        self.channels: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.channels = json.load(f)["channels"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"集計ファイルの読み込みに失敗しました。全期間を集計し直します: {e}")
+
+    def _initial_since(self) -> int:
+        if not self.backfill_days:
+            return 0
+        start = datetime.datetime.now() - datetime.timedelta(days=self.backfill_days)
+        return int(start.timestamp() * 1000)
+
+    def _iter_pages_newest_first(
+        self, client: MattermostClient, channel_id: str, since: int
+    ) -> Iterator[Dict[str, Any]]:
+        # 新しい順にページを取得し、since 以前の投稿に達したら終了します。
+        page = 0
+        while True:
+            response = client.get(f"/channels/{channel_id}/posts", params={"page": page, "per_page": PER_PAGE})
+            response.raise_for_status()
+            data = response.json()
+            posts = [data["posts"][post_id] for post_id in data["order"]]
+            yield from posts
+            if len(posts) < PER_PAGE or min(post["create_at"] for post in posts) <= since:
+                return
+            page += 1
+
+    def _iter_new_posts(self, client: MattermostClient, channel_id: str, since: int) -> Iterator[Dict[str, Any]]:
+        if since:
+            response = client.get(f"/channels/{channel_id}/posts", params={"since": since})
+            response.raise_for_status()
+            posts = list(response.json()["posts"].values())
+            if len(posts) < SINCE_LIMIT:
+                yield from posts
+                return
+        yield from self._iter_pages_newest_first(client, channel_id, since)
+
+    def update_channel(self, client: MattermostClient, channel: Dict[str, Any]) -> int:
+        """チャンネルの新しい投稿を取得してカウンターに加え、数えた投稿数を返します。
+
+        チャンネル情報の last_post_at が since 以前の場合は、投稿を取得しません。
+        """
+        with self._lock:
+            state = self.channels.get(channel["id"])
+        if state is None:
+            state = {"since": self._initial_since(), "days": {}, "users": {}}
+        since = state["since"]
+        if since and "last_post_at" in channel and channel["last_post_at"] <= since:
+            return 0
+
+        days: Dict[str, int] = dict(state["days"])
+        users: Dict[str, List[int]] = {user_id: list(value) for user_id, value in state["users"].items()}
+        seen: Set[str] = set()
+        high_water_mark = since
+        counted = 0
+        for post in self._iter_new_posts(client, channel["id"], since):
+            create_at = post["create_at"]
+            if create_at <= since or post["id"] in seen:
+                continue
+            seen.add(post["id"])
+            high_water_mark = max(high_water_mark, create_at)
+            if post.get("delete_at") or post.get("type", "").startswith("system_"):
+                continue
+            day = _day(create_at)
+            days[day] = days.get(day, 0) + 1
+            count, last = users.get(post["user_id"], (0, 0))
+            users[post["user_id"]] = [count + 1, max(last, create_at)]
+            counted += 1
+
+        # 取得を終えてからまとめて置き換えるため、途中で失敗したチャンネルは前回の状態のままです。
+        with self._lock:
+            self.channels[channel["id"]] = {"since": high_water_mark, "days": days, "users": users}
+        return counted
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps({"channels": self.channels}, ensure_ascii=False)
+        # 書き込み途中で止まっても前回の集計が壊れないよう、一時ファイルから置き換えます。
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temporary_path, self.path)
+
+    def summary_row(self, channel_id: str, weeks: int, today: datetime.date) -> Dict[str, Any]:
+        """チャンネルの投稿数、投稿者数と、直近 weeks 週の週ごとの投稿数を返します。
+
+        週は月曜日から始まり、列名はその月曜日の日付です。直近 weeks 週の投稿者数も返します。
+        """
+        state = self.channels.get(channel_id, {"days": {}, "users": {}})
+        this_week = today - datetime.timedelta(days=today.weekday())
+        week_starts = [this_week - datetime.timedelta(weeks=weeks - 1 - i) for i in range(weeks)]
+        window_start = datetime.datetime.combine(week_starts[0], datetime.time()).timestamp() * 1000
+
+        week_counts = {week_start.isoformat(): 0 for week_start in week_starts}
+        for day, count in state["days"].items():
+            date = datetime.date.fromisoformat(day)
+            week_start = (date - datetime.timedelta(days=date.weekday())).isoformat()
+            if week_start in week_counts:
+                week_counts[week_start] += count
+
+        return {
+            "Posts": sum(state["days"].values()),
+            "Active Posters": len(state["users"]),
+            f"Active Posters ({weeks}w)": sum(1 for _, last in state["users"].values() if last >= window_start),
+            **week_counts,
+        }
@@ -0,0 +1,27 @@
+import json  # JSON形式のデータを扱うためのライブラリ
+from typing import Any, Dict, Optional
+
+# 各スクリプトが読み込む設定ファイルです。mattermost-cli.py の --config で変更できます。
+_path = "config.json"
+_config: Optional[Dict[str, Any]] = None
+
+
+def set_config_path(path: str) -> None:
+    """読み込む設定ファイルを変更します。次の load_config で読み込み直します。"""
+    global _path, _config
+    _path = path
+    _config = None
+
+
+def load_config() -> Dict[str, Any]:
+    """設定ファイルを読み込みます。
+
+    同じプロセスでは一度だけ読み込み、以降は読み込んだ内容の複製を返します。
+    mattermost-cli.py の --batch で複数の処理を続けて実行しても、読み込みは 1 回です。
+    ファイルがない場合は FileNotFoundError、JSON として読めない場合は json.JSONDecodeError を送出します。
+    """
+    global _config
+    if _config is None:
+        with open(_path, encoding="utf-8") as f:
+            _config = json.load(f)
+    return dict(_config)
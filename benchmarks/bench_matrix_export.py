@@ -0,0 +1,85 @@
+"""合成データの参加状況の表を Excel に書き出し、所要時間とピークメモリを表示するベンチマークです。
+
+使用方法: python benchmarks/bench_matrix_export.py [--users 5000] [--channels 500] [--teams 1] [--trace-memory]
+
+書き出し時間は tracemalloc を止めた状態で測り、メモリはプロセスの最大RSS（書き出しの前後）で示します。
+--trace-memory を指定すると、書き出しをもう一度 tracemalloc を有効にして実行し、ピークメモリを表示します。
+tracemalloc は書き出しを数倍遅くするため、時間の計測とは別に実行します。
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matrix_export import write_membership_matrix  # noqa: E402
+from membership_index import MembershipIndex  # noqa: E402
+
+
+def build_matrix(users: int, channels: int, teams: int, density: float, seed: int = 1) -> MembershipIndex:
+    rnd = random.Random(seed)
+    user_dict = {f"user{i:06d}": f"user{i}" for i in range(users)}
+    user_ids = list(user_dict)
+    team_list = [{"id": f"team{t}", "display_name": f"Team {t}"} for t in range(teams)]
+    channel_lists = {
+        team["id"]: [
+            {"id": f"{team['id']}-channel{c}", "display_name": f"Channel {c}"}
+            for c in range(channels // teams)
+        ]
+        for team in team_list
+    }
+    members = {
+        channel["id"]: rnd.sample(user_ids, int(users * density))
+        for team_channels in channel_lists.values()
+        for channel in team_channels
+    }
+    return MembershipIndex.build(user_dict, team_list, channel_lists, members)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--teams", type=int, default=1)
+    parser.add_argument("--density", type=float, default=0.1, help="チャンネルあたりの参加率")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="tracemalloc で書き出し中のピークメモリも測ります（時間がかかります）"
+    )
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    index = build_matrix(args.users, args.channels, args.teams, args.density)
+    index_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "matrix.xlsx")
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        write_membership_matrix(path, index)
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        size = os.path.getsize(path)
+
+        peak = None
+        if args.trace_memory:
+            tracemalloc.start()
+            write_membership_matrix(path, index)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    print(f"表の大きさ: {args.users} ユーザー x {args.channels} チャンネル ({args.teams} チーム)")
+    print(f"参加状況の索引のメモリ (tracemalloc): {index_size / 1024 / 1024:.1f} MiB")
+    print(f"書き出し時間: {elapsed:.1f} 秒")
+    print(f"プロセスの最大RSS: 書き出し前 {rss_before / 1024:.1f} MiB, 書き出し後 {rss_after / 1024:.1f} MiB")
+    if peak is not None:
+        print(f"書き出し中のピークメモリ (tracemalloc): {peak / 1024 / 1024:.1f} MiB")
+    print(f"ファイルサイズ: {size / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""ローカルの代替サーバーに対して 4 つの処理を実行し、規模ごとのリクエスト数、所要時間、
+最大RSSを記録するベンチマークです。
+
+使用方法: python benchmarks/bench_scaling.py [--sizes small,medium] [--output results.json]
+                                             [--baseline results.json] [--latency-ms 0]
+                                             [--throttle-every 0]
+
+--baseline を指定すると前回の結果と比較し、リクエスト数が増えた場合や所要時間が
+--tolerance を超えて伸びた場合は終了コード 1 で終了します。
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from openpyxl import load_workbook
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from fake_mattermost import FakeData, start_server  # noqa: E402
+
+# 規模ごとの合成データの設定です。register は新規登録する CSV の行数です。
+SIZES: Dict[str, Dict[str, int]] = {
+    "small": {"users": 200, "teams": 2, "channels": 20, "members_per_channel": 20, "register": 50},
+    "medium": {"users": 2000, "teams": 5, "channels": 200, "members_per_channel": 50, "register": 500},
+    "large": {"users": 10000, "teams": 10, "channels": 2000, "members_per_channel": 50, "register": 2000},
+}
+
+# 実行する処理の名前と、スクリプトおよび引数です。
+FLOWS = [
+    ("membership-export", "mattermost-current-user-list.py", []),
+    ("instruction-apply", "mattermost-user-management.py", []),
+    ("last-message", "output_last_message.py", []),
+    ("registration", "register_users.py", ["--concurrency", "8"]),
+]
+
+
+# 子プロセスの終了時に /proc/self/status の VmHWM（最大RSS）をファイルに書き出してからスクリプトを実行します。
+# ru_maxrss は fork 時の親プロセスの RSS を含んでしまうため使いません。
+MEASURED_RUNNER = """
+import atexit, runpy, sys
+def write_peak_rss(path=sys.argv[1]):
+    with open("/proc/self/status") as status, open(path, "w") as out:
+        out.write(next(line.split()[1] for line in status if line.startswith("VmHWM:")))
+atexit.register(write_peak_rss)
+sys.argv = sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run_flow(script: str, arguments: List[str], workdir: str, handler: Any) -> Dict[str, Any]:
+    peak_path = os.path.join(workdir, "peak_rss.txt")
+    start_count = handler.request_count
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", MEASURED_RUNNER, peak_path, os.path.join(REPO_DIR, script), *arguments],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": REPO_DIR},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        print(f"{script} が失敗しました:\n{process.stderr.decode(errors='replace')}", file=sys.stderr)
+    with open(peak_path) as f:
+        peak_kib = int(f.read() or 0)
+    return {
+        "requests": handler.request_count - start_count,
+        "seconds": round(elapsed, 3),
+        "max_rss_mib": round(peak_kib / 1024, 1),
+        "ok": process.returncode == 0,
+    }
+
+
+def flip_instructions(path: str, every: int = 7) -> None:
+    # 書き出された表の "(指示)" の列を一定間隔で書き換え、招待と退会を発生させます。
+    wb = load_workbook(path)
+    for ws in wb.worksheets:
+        for row in ws.iter_rows(min_row=2, min_col=3):
+            for i, cell in enumerate(row[::2]):
+                if (cell.row + i) % every == 0:
+                    cell.value = "" if cell.value == "〇" else "〇"
+    wb.save(path)
+
+
+def write_registration_csv(path: str, rows: int, teams: int, channels: int) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "username", "password", "first_name", "last_name", "team_name", "channel_name"])
+        for i in range(rows):
+            channel = i % channels
+            writer.writerow(
+                [f"new{i}@example.com", f"new{i}", "Passw0rd!", "New", f"User{i}", f"team{channel % teams}", f"channel{channel}"]
+            )
+
+
+def run_size(name: str, latency: float, throttle_every: int) -> Dict[str, Any]:
+    size = SIZES[name]
+    data = FakeData(size["users"], size["teams"], size["channels"], size["members_per_channel"])
+    server, url = start_server(data, latency=latency, throttle_every=throttle_every)
+    handler = server.RequestHandlerClass
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = {
+                "url": url,
+                "token": "benchmark",
+                "excel_dir": workdir + os.sep,
+                "excel_file": "matrix.xlsx",
+                "csv_file": "users.csv",
+                "concurrency": 8,
+            }
+            with open(os.path.join(workdir, "config.json"), "w") as f:
+                json.dump(config, f)
+            write_registration_csv(
+                os.path.join(workdir, "users.csv"), size["register"], size["teams"], size["channels"]
+            )
+
+            for flow, script, arguments in FLOWS:
+                if flow == "instruction-apply":
+                    flip_instructions(os.path.join(workdir, "matrix.xlsx"))
+                results[flow] = run_flow(script, arguments, workdir, handler)
+                print(
+                    f"{name:<7} {flow:<18} {results[flow]['requests']:>8} {results[flow]['seconds']:>9.2f} "
+                    f"{results[flow]['max_rss_mib']:>9.1f} {'' if results[flow]['ok'] else '失敗'}"
+                )
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    ok = True
+    for size, flows in results.items():
+        for flow, current in flows.items():
+            previous = baseline.get(size, {}).get(flow)
+            if not previous:
+                continue
+            if current["requests"] > previous["requests"] or current["seconds"] > previous["seconds"] * (1 + tolerance):
+                ok = False
+                print(
+                    f"劣化: {size} {flow} リクエスト数 {previous['requests']} -> {current['requests']}, "
+                    f"所要時間 {previous['seconds']:.2f} -> {current['seconds']:.2f} 秒"
+                )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="small", help=f"カンマ区切りの規模（{', '.join(SIZES)}）")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="代替サーバーの各応答に挿入する遅延（ミリ秒）")
+    parser.add_argument("--throttle-every", type=int, default=0, help="代替サーバーが N 回に 1 回 429 を返します")
+    parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果の JSON ファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="所要時間の許容する伸び率")
+    args = parser.parse_args()
+
+    print(f"{'規模':<7} {'処理':<18} {'リクエスト':>8} {'秒':>9} {'RSS(MiB)':>9}")
+    results = {name: run_size(name, args.latency_ms / 1000, args.throttle_every) for name in args.sizes.split(",")}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""mattermost-cli.py の起動時間と、--batch で複数の処理を 1 つのプロセスで実行した場合の
+所要時間を測るベンチマークです。
+
+使用方法: python benchmarks/bench_startup.py [--runs 5] [--operations 10] [--max-ms 0] [--max-subcommand-ms 0]
+
+各コマンドを python -X importtime で実行し、所要時間の中央値、モジュールの読み込み時間の合計、
+読み込みに時間のかかったモジュールと、pandas / openpyxl / aiohttp を読み込んだかどうかを表示します。
+続いて、サーバーに接続しない apply-instructions --plan-only を --operations 回、
+別々のプロセスで実行した場合と --batch でまとめて実行した場合の所要時間を比較します。
+
+--max-ms を指定すると、mattermost-cli.py --help の所要時間の中央値がそれを超えた場合と、
+--help または各サブコマンドの --help で pandas / openpyxl / aiohttp を読み込んだ場合に終了コード 1 で終了します。
+--max-subcommand-ms を指定すると、各サブコマンドの --help の所要時間の中央値がそれを超えた場合も終了コード 1 で終了します。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_matrix_export import build_matrix  # noqa: E402
+from matrix_export import write_membership_matrix  # noqa: E402
+
+CLI = os.path.join(ROOT, "mattermost-cli.py")
+
+# 起動時に読み込みたくない、読み込みに時間のかかるライブラリです。
+HEAVY_MODULES = ("pandas", "openpyxl", "aiohttp")
+
+COMMANDS = [
+    ["--help"],
+    ["register", "--help"],
+    ["export-matrix", "--help"],
+    ["apply-instructions", "--help"],
+    ["last-message", "--help"],
+]
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, int], Set[str]]:
+    """python -X importtime の出力から、(トップレベルのモジュールごとの累積の読み込み時間（マイクロ秒）,
+    読み込んだすべてのパッケージ名) を返します。"""
+    modules = {}
+    packages = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        packages.add(name.strip().split(".")[0])
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return modules, packages
+
+
+def measure(arguments: List[str], runs: int, cwd: str) -> Tuple[float, Dict[str, int], Set[str]]:
+    times = []
+    modules: Dict[str, int] = {}
+    packages: Set[str] = set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", CLI] + arguments, cwd=cwd, capture_output=True, text=True
+        )
+        times.append(time.perf_counter() - start)
+        modules, packages = parse_importtime(completed.stderr)
+    return statistics.median(times), modules, packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="各コマンドを実行する回数")
+    parser.add_argument("--operations", type=int, default=10, help="比較に使う処理の件数")
+    parser.add_argument("--max-ms", type=float, default=0, help="--help の所要時間の上限（ミリ秒、0 で確認しない）")
+    parser.add_argument(
+        "--max-subcommand-ms",
+        type=float,
+        default=0,
+        help="各サブコマンドの --help の所要時間の上限（ミリ秒、0 で確認しない）",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # サーバーに接続しない処理だけを使うため、接続先は使われません。
+        with open(os.path.join(directory, "config.json"), "w") as f:
+            json.dump(
+                {
+                    "url": "http://127.0.0.1:9",
+                    "token": "bench",
+                    "excel_dir": directory + os.sep,
+                    "excel_file": "matrix.xlsx",
+                    "csv_file": "users.csv",
+                },
+                f,
+            )
+        write_membership_matrix(os.path.join(directory, "matrix.xlsx"), build_matrix(200, 20, 2, 0.1))
+
+        print(f"{'コマンド':<36} {'中央値(ms)':>10} {'読み込み(ms)':>12}  重いライブラリ / 読み込みの長いモジュール")
+        failed = False
+        for arguments in COMMANDS:
+            median, modules, packages = measure(arguments, args.runs, directory)
+            heavy = [name for name in HEAVY_MODULES if name in packages]
+            slowest = sorted(modules.items(), key=lambda item: -item[1])[:3]
+            print(
+                f"{' '.join(arguments):<36} {median * 1000:>10.1f} {sum(modules.values()) / 1000:>12.1f}  "
+                f"{','.join(heavy) or '-'} / {', '.join(f'{name} {value / 1000:.0f}ms' for name, value in slowest)}"
+            )
+            # サブコマンドの --help と引数の誤りでも、重いライブラリは読み込まないことを確認します。
+            limit = args.max_ms if arguments == ["--help"] else args.max_subcommand_ms
+            if (args.max_ms or args.max_subcommand_ms) and heavy:
+                print(f"  {' '.join(arguments)} で {', '.join(heavy)} を読み込んでいます")
+                failed = True
+            if limit and median * 1000 > limit:
+                print(f"  {' '.join(arguments)} の所要時間が上限 ({limit:.0f} ms) を超えています")
+                failed = True
+
+        # 同じ処理を別々のプロセスで実行した場合と、--batch でまとめて実行した場合を比較します。
+        operation = ["apply-instructions", "--plan-only"]
+        start = time.perf_counter()
+        for _ in range(args.operations):
+            subprocess.run([sys.executable, CLI] + operation, cwd=directory, capture_output=True, check=True)
+        separate = time.perf_counter() - start
+
+        batch_path = os.path.join(directory, "batch.txt")
+        with open(batch_path, "w") as f:
+            f.write("\n".join(" ".join(operation) for _ in range(args.operations)) + "\n")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI, "--batch", batch_path], cwd=directory, capture_output=True, check=True)
+        batch = time.perf_counter() - start
+
+        print(
+            f"\n{' '.join(operation)} x {args.operations}: 別々のプロセス {separate:.2f} 秒, --batch {batch:.2f} 秒"
+            f" ({separate / batch:.1f} 倍)"
+        )
+
+    if failed:
+        print("mattermost-cli.py の起動が上限を超えたか、--help で重いライブラリを読み込んでいます")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
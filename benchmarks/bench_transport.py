@@ -0,0 +1,237 @@
+"""ローカルのスタブサーバーに対して、従来の requests.get と MattermostClient の
+スループットを比較するベンチマークです。
+
+使用方法: python benchmarks/bench_transport.py [--requests 500] [--throttle-every 0] [--checks-only]
+
+スループットの比較の前に、MattermostClient のリトライと待機が次のとおりであることを確認します。
+いずれかが失敗した場合は、終了コード 1 で終了します。
+
+- Retry-After 付きの 429 は、その秒数だけ待ってリトライする
+- X-RateLimit-Remaining が 0 の応答を受けたら、X-RateLimit-Reset の秒数だけ次のリクエストを待つ
+- 5xx が続く場合は max_retries 回リトライしたところで打ち切り、最後の応答を返す
+- POST は 5xx ではリトライせず、429 ではリトライする
+- タイムアウトは GET ではリトライし、max_retries 回で requests.Timeout を送出する
+
+--throttle-every N を指定すると、スタブサーバーは N 回に 1 回 429 を返します。
+従来の呼び出し方では失敗したリクエストの数を、MattermostClient ではリトライにより
+全件成功することを表示します。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mattermost_api import MattermostClient  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive を有効にするため HTTP/1.1 で応答します。
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    throttle_every = 0
+    counter = 0
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        with StubHandler.lock:
+            StubHandler.counter += 1
+            throttled = self.throttle_every and StubHandler.counter % self.throttle_every == 0
+
+        if throttled:
+            body = b'{"message": "too many requests"}'
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+        else:
+            body = json.dumps({"id": "stub", "username": "stub"}).encode()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class ScenarioHandler(BaseHTTPRequestHandler):
+    """パスごとに決めた順番で応答を返すスタブです。確認の各項目で使います。
+
+    /scenario/<名前> への n 回目のリクエストには SCENARIOS[名前] の n 番目（足りなければ最後）の
+    (ステータス, ヘッダー, 応答までの秒数) を返します。
+    """
+
+    protocol_version = "HTTP/1.1"
+    SCENARIOS: Dict[str, List[Tuple[int, Dict[str, str], float]]] = {
+        "retry-after": [(429, {"Retry-After": "1"}, 0), (200, {}, 0)],
+        "rate-limit": [(200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1"}, 0), (200, {}, 0)],
+        "always-503": [(503, {}, 0)],
+        "post-502": [(502, {}, 0), (201, {}, 0)],
+        "post-429": [(429, {"Retry-After": "0"}, 0), (201, {}, 0)],
+        "slow": [(200, {}, 2)],
+    }
+    hits: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def _respond(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        name = self.path.rsplit("/", 1)[-1]
+        with ScenarioHandler.lock:
+            count = ScenarioHandler.hits.get(name, 0)
+            ScenarioHandler.hits[name] = count + 1
+        steps = self.SCENARIOS[name]
+        status, headers, delay = steps[min(count, len(steps) - 1)]
+        time.sleep(delay)
+        body = b"{}"
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def check_retry_after(url: str) -> str:
+    client = MattermostClient(url, "stub", backoff_factor=0)
+    start = time.perf_counter()
+    response = client.get("/scenario/retry-after")
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f"ステータス {response.status_code}"
+    assert ScenarioHandler.hits["retry-after"] == 2, f"リクエスト数 {ScenarioHandler.hits['retry-after']}"
+    assert elapsed >= 0.9, f"待機 {elapsed:.2f} 秒"
+    return f"429 の後 {elapsed:.2f} 秒待って成功"
+
+
+def check_rate_limit_pause(url: str) -> str:
+    client = MattermostClient(url, "stub", backoff_factor=0)
+    client.get("/scenario/rate-limit")
+    start = time.perf_counter()
+    response = client.get("/scenario/rate-limit")
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f"ステータス {response.status_code}"
+    assert elapsed >= 0.9, f"待機 {elapsed:.2f} 秒"
+    return f"次のリクエストを {elapsed:.2f} 秒待機"
+
+
+def check_max_retries(url: str) -> str:
+    client = MattermostClient(url, "stub", max_retries=3, backoff_factor=0)
+    response = client.get("/scenario/always-503")
+    assert response.status_code == 503, f"ステータス {response.status_code}"
+    assert ScenarioHandler.hits["always-503"] == 4, f"リクエスト数 {ScenarioHandler.hits['always-503']}"
+    return "3 回リトライして 503 を返却"
+
+
+def check_post_retries(url: str) -> str:
+    client = MattermostClient(url, "stub", backoff_factor=0)
+    response = client.post("/scenario/post-502", json={})
+    assert response.status_code == 502, f"5xx のステータス {response.status_code}"
+    assert ScenarioHandler.hits["post-502"] == 1, f"5xx のリクエスト数 {ScenarioHandler.hits['post-502']}"
+    response = client.post("/scenario/post-429", json={})
+    assert response.status_code == 201, f"429 のステータス {response.status_code}"
+    assert ScenarioHandler.hits["post-429"] == 2, f"429 のリクエスト数 {ScenarioHandler.hits['post-429']}"
+    return "502 はリトライせず、429 はリトライして成功"
+
+
+def check_timeout(url: str) -> str:
+    client = MattermostClient(url, "stub", max_retries=1, backoff_factor=0, timeout=0.2)
+    try:
+        client.get("/scenario/slow")
+    except requests.Timeout:
+        pass
+    else:
+        raise AssertionError("requests.Timeout が送出されませんでした")
+    assert ScenarioHandler.hits["slow"] == 2, f"リクエスト数 {ScenarioHandler.hits['slow']}"
+    return "1 回リトライして requests.Timeout を送出"
+
+
+CHECKS: List[Tuple[str, Callable[[str], str]]] = [
+    ("Retry-After 付きの 429", check_retry_after),
+    ("X-RateLimit-Remaining: 0 の待機", check_rate_limit_pause),
+    ("max_retries での打ち切り", check_max_retries),
+    ("POST のリトライ", check_post_retries),
+    ("タイムアウト", check_timeout),
+]
+
+
+def run_checks() -> bool:
+    """確認の各項目を実行して結果を表示し、すべて成功したかどうかを返します。"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ScenarioHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    passed = True
+    for name, check in CHECKS:
+        try:
+            print(f"OK  {name}: {check(url)}")
+        except Exception as e:
+            print(f"NG  {name}: {type(e).__name__}: {e}")
+            passed = False
+    server.shutdown()
+    return passed
+
+
+def run_plain(url: str, count: int) -> int:
+    failures = 0
+    for _ in range(count):
+        response = requests.get(f"{url}/api/v4/users/me", headers={"Authorization": "Bearer stub"})
+        if response.status_code != 200:
+            failures += 1
+    return failures
+
+
+def run_client(url: str, count: int) -> int:
+    client = MattermostClient(url, "stub", backoff_factor=0)
+    failures = 0
+    for _ in range(count):
+        if client.get("/users/me").status_code != 200:
+            failures += 1
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--checks-only", action="store_true", help="リトライと待機の確認のみ実行します")
+    args = parser.parse_args()
+
+    passed = run_checks()
+    if args.checks_only:
+        sys.exit(0 if passed else 1)
+
+    StubHandler.throttle_every = args.throttle_every
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    for name, runner in (("requests.get", run_plain), ("MattermostClient", run_client)):
+        start = time.perf_counter()
+        failures = runner(url, args.requests)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<18} {args.requests / elapsed:8.1f} req/s  失敗: {failures}/{args.requests}"
+        )
+
+    server.shutdown()
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
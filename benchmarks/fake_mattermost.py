@@ -0,0 +1,354 @@
+"""ベンチマーク用のローカルの Mattermost API の代替サーバーです。
+
+各スクリプトが使うエンドポイント（ユーザー、チーム、チャンネル、メンバー、投稿、検索）だけを
+メモリ上の合成データで実装します。応答の遅延と 429 を任意に挿入できます。
+
+単体で起動する場合: python benchmarks/fake_mattermost.py --users 1000 --teams 5 --channels 100
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+# 合成データの投稿日時の基準（ミリ秒）です。
+BASE_TIME = 1_700_000_000_000
+
+
+def make_id(prefix: str, number: int) -> str:
+    # Mattermost と同じ 26 文字の英数字のIDを作ります。
+    return f"{prefix}{number:0{25}d}"[:26]
+
+
+class FakeData:
+    """合成したユーザー、チーム、チャンネル、参加状況、投稿を保持します。"""
+
+    def __init__(
+        self,
+        users: int = 100,
+        teams: int = 2,
+        channels: int = 10,
+        members_per_channel: int = 20,
+        posts_per_channel: int = 5,
+        seed: int = 1,
+    ) -> None:
+        rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.teams: Dict[str, Dict[str, Any]] = {}
+        self.channels: Dict[str, Dict[str, Any]] = {}
+        self.team_members: Dict[str, Set[str]] = {}
+        self.members: Dict[str, Set[str]] = {}
+        self.posts: Dict[str, List[Dict[str, Any]]] = {}
+        self.post_count = 0
+        self.by_email: Dict[str, str] = {}
+        self.by_username: Dict[str, str] = {}
+
+        for i in range(users):
+            self._add_user(f"user{i}", f"user{i}@example.com", BASE_TIME)
+        user_ids = list(self.users)
+
+        for t in range(teams):
+            team_id = make_id("t", t)
+            self.teams[team_id] = {
+                "id": team_id,
+                "name": f"team{t}",
+                "display_name": f"Team {t}",
+                "update_at": BASE_TIME,
+                "delete_at": 0,
+            }
+            self.team_members[team_id] = set(user_ids)
+
+        team_ids = list(self.teams)
+        for c in range(channels):
+            channel_id = make_id("c", c)
+            team_id = team_ids[c % len(team_ids)]
+            self.channels[channel_id] = {
+                "id": channel_id,
+                "team_id": team_id,
+                "name": f"channel{c}",
+                "display_name": f"Channel {c}",
+                "type": "P" if c % 5 == 4 else "O",
+                "update_at": BASE_TIME,
+                "delete_at": 0,
+                "last_post_at": 0,
+            }
+            self.members[channel_id] = set(rnd.sample(user_ids, min(members_per_channel, len(user_ids))))
+            self.posts[channel_id] = []
+            for p in range(posts_per_channel):
+                self._add_post(channel_id, rnd.choice(user_ids), BASE_TIME + p * 3_600_000 + c)
+
+    def _add_user(self, username: str, email: str, update_at: int) -> Dict[str, Any]:
+        user_id = make_id("u", len(self.users))
+        self.users[user_id] = {
+            "id": user_id,
+            "username": username,
+            "email": email,
+            "update_at": update_at,
+            "delete_at": 0,
+        }
+        self.by_email[email] = user_id
+        self.by_username[username] = user_id
+        return self.users[user_id]
+
+    def _add_post(self, channel_id: str, user_id: str, create_at: int) -> None:
+        post_id = make_id("p", self.post_count)
+        self.post_count += 1
+        self.posts[channel_id].append(
+            {"id": post_id, "channel_id": channel_id, "user_id": user_id, "create_at": create_at, "message": "hello"}
+        )
+        self.channels[channel_id]["last_post_at"] = max(self.channels[channel_id]["last_post_at"], create_at)
+
+
+def _page(items: List[Any], query: Dict[str, List[str]]) -> List[Any]:
+    page = int(query.get("page", ["0"])[0])
+    per_page = int(query.get("per_page", ["60"])[0])
+    return items[page * per_page : (page + 1) * per_page]
+
+
+def _posts_response(posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"order": [post["id"] for post in posts], "posts": {post["id"]: post for post in posts}}
+
+
+Route = Tuple[str, "re.Pattern[str]", Callable[..., Tuple[int, Any]]]
+
+
+class FakeMattermostHandler(BaseHTTPRequestHandler):
+    # keep-alive を有効にするため HTTP/1.1 で応答します。
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    data: FakeData
+    latency = 0.0
+    throttle_every = 0
+    bulk_members = True
+    request_count = 0
+    counter_lock = threading.Lock()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = unquote(parsed.path)[len("/api/v4") :]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        handler_class = type(self)
+        with handler_class.counter_lock:
+            handler_class.request_count += 1
+            throttled = self.throttle_every and handler_class.request_count % self.throttle_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            self._send(429, {"message": "too many requests"}, {"Retry-After": "0", "X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": "0"})
+            return
+
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                with self.data.lock:
+                    status, payload = handler(self, query, body, *match.groups())
+                self._send(status, payload)
+                return
+        self._send(404, {"message": f"{method} {path} is not implemented"})
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    # --- ユーザー ---
+
+    def list_users(self, query, body):
+        return 200, _page(list(self.data.users.values()), query)
+
+    def user_by_email(self, query, body, email):
+        user_id = self.data.by_email.get(email)
+        return (200, self.data.users[user_id]) if user_id else (404, {"message": "user not found"})
+
+    def user_by_username(self, query, body, username):
+        user_id = self.data.by_username.get(username)
+        return (200, self.data.users[user_id]) if user_id else (404, {"message": "user not found"})
+
+    def users_by_usernames(self, query, body):
+        user_ids = [self.data.by_username.get(name) for name in body or []]
+        return 200, [self.data.users[user_id] for user_id in user_ids if user_id]
+
+    def users_by_ids(self, query, body):
+        return 200, [self.data.users[i] for i in body or [] if i in self.data.users]
+
+    def search_users(self, query, body):
+        term = (body or {}).get("term", "")
+        return 200, [u for u in self.data.users.values() if u["username"].startswith(term) or u["email"].startswith(term)][:100]
+
+    def create_user(self, query, body):
+        if body["email"] in self.data.by_email or body["username"] in self.data.by_username:
+            return 400, {"message": "An account with that email or username already exists."}
+        return 201, self.data._add_user(body["username"], body["email"], int(time.time() * 1000))
+
+    # --- チーム ---
+
+    def list_teams(self, query, body):
+        return 200, _page(list(self.data.teams.values()), query)
+
+    def search_teams(self, query, body):
+        term = (body or {}).get("term", "")
+        return 200, [t for t in self.data.teams.values() if term in (t["name"], t["display_name"])]
+
+    def team_by_name(self, query, body, name):
+        team = next((t for t in self.data.teams.values() if t["name"] == name), None)
+        return (200, team) if team else (404, {"message": "team not found"})
+
+    def add_team_member(self, query, body, team_id):
+        self.data.team_members.setdefault(team_id, set()).add(body["user_id"])
+        return 201, {"team_id": team_id, "user_id": body["user_id"]}
+
+    # --- チャンネル ---
+
+    def _team_channels(self, team_id, channel_types):
+        return [c for c in self.data.channels.values() if c["team_id"] == team_id and c["type"] in channel_types]
+
+    def public_channels(self, query, body, team_id):
+        return 200, _page(self._team_channels(team_id, "O"), query)
+
+    def private_channels(self, query, body, team_id):
+        return 200, _page(self._team_channels(team_id, "P"), query)
+
+    def my_channels(self, query, body, team_id):
+        return 200, self._team_channels(team_id, "OP")
+
+    def channel_by_name(self, query, body, team_id, name):
+        channel = next((c for c in self._team_channels(team_id, "OP") if c["name"] == name), None)
+        return (200, channel) if channel else (404, {"message": "channel not found"})
+
+    def channel_members(self, query, body, channel_id):
+        members = [{"channel_id": channel_id, "user_id": u} for u in sorted(self.data.members.get(channel_id, ()))]
+        return 200, _page(members, query)
+
+    def channel_stats(self, query, body, channel_id):
+        if channel_id not in self.data.channels:
+            return 404, {"message": "channel not found"}
+        return 200, {"channel_id": channel_id, "member_count": len(self.data.members[channel_id])}
+
+    def add_channel_members(self, query, body, channel_id):
+        if channel_id not in self.data.channels:
+            return 404, {"message": "channel not found"}
+        if "user_ids" in body and not self.bulk_members:
+            return 400, {"message": "Invalid or missing user_id in request body."}
+        user_ids = body.get("user_ids") or [body["user_id"]]
+        if any(user_id not in self.data.users for user_id in user_ids):
+            return 400, {"message": "Invalid or missing user_id in request body."}
+        for user_id in user_ids:
+            if user_id not in self.data.members[channel_id]:
+                self.data.members[channel_id].add(user_id)
+                self.data._add_post(channel_id, user_id, int(time.time() * 1000))
+        members = [{"channel_id": channel_id, "user_id": u} for u in user_ids]
+        return 201, members if "user_ids" in body else members[0]
+
+    def remove_channel_member(self, query, body, channel_id, user_id):
+        if user_id in self.data.members.get(channel_id, set()):
+            self.data.members[channel_id].discard(user_id)
+            self.data._add_post(channel_id, user_id, int(time.time() * 1000))
+        return 200, {"status": "OK"}
+
+    def channel_posts(self, query, body, channel_id):
+        posts = sorted(self.data.posts.get(channel_id, []), key=lambda post: -post["create_at"])
+        if "since" in query:
+            since = int(query["since"][0])
+            return 200, _posts_response([post for post in posts if post["create_at"] > since])
+        return 200, _posts_response(_page(posts, query))
+
+
+ROUTES: List[Route] = [
+    (method, re.compile(pattern), handler)
+    for method, pattern, handler in [
+        ("GET", r"/users", FakeMattermostHandler.list_users),
+        ("GET", r"/users/email/([^/]+)", FakeMattermostHandler.user_by_email),
+        ("GET", r"/users/username/([^/]+)", FakeMattermostHandler.user_by_username),
+        ("POST", r"/users/usernames", FakeMattermostHandler.users_by_usernames),
+        ("POST", r"/users/ids", FakeMattermostHandler.users_by_ids),
+        ("POST", r"/users/search", FakeMattermostHandler.search_users),
+        ("POST", r"/users", FakeMattermostHandler.create_user),
+        ("GET", r"/users/me/teams/([^/]+)/channels", FakeMattermostHandler.my_channels),
+        ("GET", r"/teams", FakeMattermostHandler.list_teams),
+        ("POST", r"/teams/search", FakeMattermostHandler.search_teams),
+        ("GET", r"/teams/name/([^/]+)", FakeMattermostHandler.team_by_name),
+        ("POST", r"/teams/([^/]+)/members", FakeMattermostHandler.add_team_member),
+        ("GET", r"/teams/([^/]+)/channels", FakeMattermostHandler.public_channels),
+        ("GET", r"/teams/([^/]+)/channels/private", FakeMattermostHandler.private_channels),
+        ("GET", r"/teams/([^/]+)/channels/name/([^/]+)", FakeMattermostHandler.channel_by_name),
+        ("GET", r"/channels/([^/]+)/members", FakeMattermostHandler.channel_members),
+        ("GET", r"/channels/([^/]+)/stats", FakeMattermostHandler.channel_stats),
+        ("POST", r"/channels/([^/]+)/members", FakeMattermostHandler.add_channel_members),
+        ("DELETE", r"/channels/([^/]+)/members/([^/]+)", FakeMattermostHandler.remove_channel_member),
+        ("GET", r"/channels/([^/]+)/posts", FakeMattermostHandler.channel_posts),
+    ]
+]
+
+
+def start_server(
+    data: FakeData,
+    latency: float = 0.0,
+    throttle_every: int = 0,
+    bulk_members: bool = True,
+    port: int = 0,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """代替サーバーを別スレッドで起動し、サーバーとベースURLを返します。"""
+    handler = type(
+        "Handler",
+        (FakeMattermostHandler,),
+        {"data": data, "latency": latency, "throttle_every": throttle_every, "bulk_members": bulk_members},
+    )
+    handler.request_count = 0
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8065)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--teams", type=int, default=2)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--members-per-channel", type=int, default=20)
+    parser.add_argument("--posts-per-channel", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="各応答に挿入する遅延（ミリ秒）")
+    parser.add_argument("--throttle-every", type=int, default=0, help="N 回に 1 回 429 を返します")
+    parser.add_argument("--no-bulk-members", action="store_true", help="user_ids による一括招待を拒否します")
+    args = parser.parse_args()
+
+    data = FakeData(args.users, args.teams, args.channels, args.members_per_channel, args.posts_per_channel)
+    server, url = start_server(
+        data, args.latency_ms / 1000, args.throttle_every, not args.no_bulk_members, args.port
+    )
+    print(f"代替サーバーを起動しました: {url} (Ctrl+C で終了)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import io  # zip 内のファイルを行単位で読むためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import mmap  # エクスポートファイルをメモリマップで読むためのライブラリ
+import zipfile  # mmctl export の zip を展開せずに読むためのライブラリ
+from typing import Any, Dict, Iterator, List, Set, Tuple
+from membership_snapshot import MembershipSnapshot  # チャンネル単位の参加状況を保持するスナップショット
+
+# 投稿の行の先頭です。投稿を使わない場合は、JSON として解析せずに読み飛ばします。
+POST_PREFIXES = (b'{"type":"post"', b'{"type": "post"')
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """バルクエクスポートの JSONL を 1 行ずつ返します。
+
+    .zip の場合は展開せず、最初の .jsonl ファイルを zip から直接読みます。
+    それ以外はファイルをメモリマップで読みます。どちらもファイル全体をメモリに読み込みません。
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.endswith(".jsonl")]
+            if not names:
+                raise ValueError(f"{path} に .jsonl ファイルがありません")
+            with archive.open(names[0]) as f:
+                yield from io.BufferedReader(f, buffer_size=1024 * 1024)
+        return
+
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter(mapped.readline, b"")
+
+
+def channel_key(team_name: str, channel_name: str) -> str:
+    # エクスポートには ID が含まれないため、チーム名とチャンネル名の組をチャンネルIDとして使います。
+    return f"{team_name}/{channel_name}"
+
+
+def _post_times(post: Dict[str, Any]) -> Iterator[int]:
+    # 返信は親の投稿の replies に含まれるため、親と合わせて投稿日時を返します。
+    if not post.get("delete_at"):
+        yield post.get("create_at", 0)
+    for reply in post.get("replies") or []:
+        if not reply.get("delete_at"):
+            yield reply.get("create_at", 0)
+
+
+class BulkExportSource:
+    """mmctl export で作成したバルクエクスポートの JSONL から参加状況を読み込むデータソースです。
+
+    ファイルを 1 行ずつ読み、チーム、チャンネル、ユーザーとその参加チャンネルを集めます。
+    投稿は保持せず、チャンネルごとの最新の投稿日時だけを last_post_at として残すため、
+    メモリは投稿数によらず、チャンネル数と参加件数に比例します。サーバーには接続しません。
+
+    ID はエクスポートに含まれないため、チーム名、"チーム名/チャンネル名"、ユーザー名を
+    それぞれチームID、チャンネルID、ユーザーIDとして使います。
+    アーカイブ済みのチームとチャンネル、ダイレクトメッセージは含めません。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def snapshot(self, posts: bool = True) -> MembershipSnapshot:
+        """API から取得した場合と同じ形の MembershipSnapshot を返します。
+
+        posts=False の場合は投稿の行を解析せず、last_post_at は 0 になります。
+        """
+        teams: List[Dict[str, Any]] = []
+        channels: Dict[str, Dict[str, Any]] = {}
+        users: Dict[str, str] = {}
+        members: Dict[str, Set[str]] = {}
+        last_post_at: Dict[str, int] = {}
+
+        for line in iter_lines(self.path):
+            if not posts and line.startswith(POST_PREFIXES):
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            kind = record.get("type")
+            if kind == "team":
+                team = record["team"]
+                if team.get("deleted_at"):
+                    continue
+                teams.append({"id": team["name"], "name": team["name"], "display_name": team["display_name"]})
+            elif kind == "channel":
+                channel = record["channel"]
+                if channel.get("deleted_at"):
+                    continue
+                key = channel_key(channel["team"], channel["name"])
+                channels[key] = {
+                    "id": key,
+                    "team_id": channel["team"],
+                    "name": channel["name"],
+                    "display_name": channel.get("display_name") or "",
+                    "type": channel.get("type", "O"),
+                    "update_at": 0,
+                    "last_post_at": 0,
+                }
+            elif kind == "user":
+                user = record["user"]
+                users[user["username"]] = user["username"]
+                for team in user.get("teams") or []:
+                    for channel in team.get("channels") or []:
+                        members.setdefault(channel_key(team["name"], channel["name"]), set()).add(user["username"])
+            elif kind == "post":
+                post = record["post"]
+                key = channel_key(post["team"], post["channel"])
+                last_post_at[key] = max(last_post_at.get(key, 0), *_post_times(post), 0)
+
+        snapshot = MembershipSnapshot()
+        snapshot.users = users
+        snapshot.teams = teams
+        # API と同様に、公開チャンネルの後に非公開チャンネルを並べ、チャンネル名が空のものは除外します。
+        for channel in sorted(channels.values(), key=lambda channel: channel["type"] != "O"):
+            if not channel["display_name"].strip():
+                continue
+            channel["last_post_at"] = last_post_at.get(channel["id"], 0)
+            snapshot.channels.setdefault(channel["team_id"], []).append(channel)
+        snapshot.members = {key: members.get(key, set()) for key in channels}
+        return snapshot
+
+    def team_channels(self) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+        """output_last_message.py の collect と同じ形の (チーム一覧, チームごとのチャンネル一覧) を返します。"""
+        snapshot = self.snapshot()
+        return snapshot.teams, [snapshot.channels.get(team["id"], []) for team in snapshot.teams]
+
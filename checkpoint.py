@@ -0,0 +1,105 @@
+import hashlib  # 入力ファイルの内容からジョブを識別するためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import os  # ファイルを扱うためのライブラリ
+import threading  # 複数スレッドからの同時記録に備えるためのライブラリ
+import time  # 書き出しの間隔を測るためのライブラリ
+from typing import Any, Dict, List, Optional
+
+
+def file_fingerprint(path: str) -> str:
+    """入力ファイルの内容の SHA-256 を返します。別の入力で再開しないよう、ジャーナルに記録します。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """完了した操作を 1 行 1 件の JSON で追記していくチェックポイントのジャーナルです。
+
+    record で受け取った操作はまとめて保持し、batch_size 件たまるか interval 秒経つごとに
+    追記して fsync します。処理が途中で止まっても、最後に書き出した分までは残ります。
+
+    resume=True の場合は既存のジャーナルを読み込み、成功済みの操作を completed で返します。
+    失敗した操作は記録されていても completed では返さないため、再開時に再実行されます。
+    resume=False の場合はジャーナルを作り直します。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fingerprint: str,
+        resume: bool = False,
+        batch_size: int = 100,
+        interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        if resume and os.path.exists(path):
+            self._load()
+            self._file = open(path, "a", encoding="utf-8")
+            if self._truncated:
+                # 書き込み途中の行に続けて書かないよう、改行してから追記します。
+                self._file.write("\n")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps({"fingerprint": fingerprint}) + "\n")
+            self._file.flush()
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read()
+        self._truncated = bool(content) and not content.endswith("\n")
+        lines = content.splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("fingerprint") != self.fingerprint:
+            raise ValueError(f"{self.path} は別の入力ファイルのジャーナルです。--resume を付けずに実行してください")
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で止まった最後の行は無視します。
+                continue
+            self.entries[entry["key"]] = entry
+
+    def completed(self, key: str) -> Optional[Any]:
+        """成功済みの操作の結果を返します。未実行または失敗した操作は None を返します。"""
+        entry = self.entries.get(key)
+        return entry["result"] if entry and entry["ok"] else None
+
+    def record(self, key: str, ok: bool, result: Any) -> None:
+        entry = {"key": key, "ok": ok, "result": result}
+        with self._lock:
+            self.entries[key] = entry
+            self._pending.append(json.dumps(entry, ensure_ascii=False))
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.interval:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._file.write("\n".join(self._pending) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def summary(self) -> str:
+        succeeded = sum(1 for entry in self.entries.values() if entry["ok"])
+        return f"ジャーナル: {self.path} (成功: {succeeded} 件, 失敗: {len(self.entries) - succeeded} 件)"
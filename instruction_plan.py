@@ -0,0 +1,166 @@
+from collections import defaultdict  # チャンネルごとに操作をまとめるための辞書
+from concurrent.futures import ThreadPoolExecutor  # チャンネル単位で並行して適用するためのスレッドプール
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from checkpoint import CheckpointJournal  # 完了した操作を記録するチェックポイントのジャーナル
+from membership_applier import BulkMembershipApplier  # チャンネルへの招待をまとめて行うクラス
+from mattermost_api import MattermostClient  # 共有の Mattermost API クライアント
+
+# 操作の種類です。
+ADD = "add"
+REMOVE = "remove"
+
+
+class Operation(NamedTuple):
+    """変更計画の 1 件分の操作です。team はシート名（チーム名）です。"""
+
+    team: str
+    channel: str
+    username: str
+    action: str
+
+
+def classify(current_status: Any, next_status: Any) -> Tuple[str, Optional[str]]:
+    """現在の参加状況と指示から、表示用の指示内容と操作の種類を返します。"""
+    if current_status == next_status:
+        return "変更なし", None
+    if next_status == "〇":
+        return "招待", ADD
+    if current_status == "〇":
+        return "退会", REMOVE
+    return f"{current_status} -> {next_status}", None
+
+
+def parse_header(header_row: Tuple[Any, ...]) -> List[Tuple[int, Any]]:
+    """見出し行から (現在の参加状況の列番号, チャンネル名) の一覧を作ります。
+
+    各チャンネルは「チャンネル名」「(指示)」の 2 列で、見出しのない列は無視します。
+    """
+    return [
+        (col_idx, header_row[col_idx])
+        for col_idx in range(1, len(header_row) - 1, 2)
+        if header_row[col_idx] is not None
+    ]
+
+
+def iter_sheet_rows(ws) -> Iterator[Tuple[Any, List[Tuple[Any, Any, Any]]]]:
+    """シートの各行を (ユーザー名, [(チャンネル名, 現在の参加状況, 指示), ...]) として返します。
+
+    読み取り専用モードのワークシートを値のみで 1 行ずつ読み、見出しは最初に一度だけ解析します。
+    """
+    rows = ws.iter_rows(values_only=True)
+    channel_columns = parse_header(next(rows, ()))
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+        cells = [
+            (
+                channel_name,
+                row[col_idx] if col_idx < len(row) else None,
+                row[col_idx + 1] if col_idx + 1 < len(row) else None,
+            )
+            for col_idx, channel_name in channel_columns
+        ]
+        yield row[0], cells
+
+
+def build_plan(wb) -> List[Operation]:
+    """ワークブックを読み、変更のあるセルだけを操作の一覧にします。"""
+    plan = []
+    for sheet_name in wb.sheetnames:
+        for username, cells in iter_sheet_rows(wb[sheet_name]):
+            for channel_name, current_status, next_status in cells:
+                _, action = classify(current_status, next_status)
+                if action:
+                    plan.append(Operation(sheet_name, channel_name, str(username), action))
+    # 同じ操作が複数回現れた場合は 1 件にまとめます。
+    return list(dict.fromkeys(plan))
+
+
+def format_plan(plan: List[Operation]) -> str:
+    lines = [
+        f"{'招待' if op.action == ADD else '退会'} | チーム名: {op.team} | チャンネル名: {op.channel} | ユーザー名: {op.username}"
+        for op in plan
+    ]
+    adds = sum(1 for op in plan if op.action == ADD)
+    channels = len({(op.team, op.channel) for op in plan})
+    lines.append(f"操作数: {len(plan)} (招待: {adds}, 退会: {len(plan) - adds}, チャンネル数: {channels})")
+    return "\n".join(lines)
+
+
+def operation_key(op: Operation) -> str:
+    """ジャーナルで操作を識別するキーです。"""
+    return "\t".join(op)
+
+
+def succeeded(result: str) -> bool:
+    """API 結果が 2xx の応答かどうかを返します。"""
+    return result.startswith("API結果: 2")
+
+
+class PlanExecutor:
+    """変更計画をチャンネル単位にまとめ、並行して適用します。
+
+    招待は BulkMembershipApplier で batch_size 件ずつ user_ids を指定した 1 回のリクエストで行い、
+    サーバーが user_ids に対応していない場合は 1 件ずつのリクエストに切り替えます。
+    """
+
+    def __init__(
+        self,
+        client: MattermostClient,
+        concurrency: int = 4,
+        batch_size: int = 100,
+        applier: Optional[BulkMembershipApplier] = None,
+    ) -> None:
+        self.client = client
+        self.concurrency = concurrency
+        self.applier = applier or BulkMembershipApplier(client, batch_size=batch_size)
+
+    def _apply_channel(
+        self, channel_id: Optional[str], ops: List[Operation], user_ids: Dict[str, Optional[str]]
+    ) -> Dict[Operation, str]:
+        if not channel_id:
+            return {op: "チャンネルが見つかりませんでした" for op in ops}
+
+        results = {op: "ユーザーが見つかりませんでした" for op in ops if not user_ids.get(op.username)}
+        adds = [op for op in ops if op.action == ADD and op not in results]
+        add_results = self.applier.add_members(channel_id, [user_ids[op.username] for op in adds])
+        for op in adds:
+            results[op] = add_results[user_ids[op.username]][1]
+
+        for op in ops:
+            if op.action == REMOVE and op not in results:
+                response = self.client.delete(f"/channels/{channel_id}/members/{user_ids[op.username]}")
+                results[op] = f"API結果: {response.status_code} {response.text}"
+        return results
+
+    def execute(
+        self,
+        plan: List[Operation],
+        channel_ids: Dict[Tuple[str, str], Optional[str]],
+        user_ids: Dict[str, Optional[str]],
+        journal: Optional[CheckpointJournal] = None,
+    ) -> Dict[Operation, str]:
+        """操作ごとの API 結果を返します。channel_ids のキーは (チーム名, チャンネル名) です。
+
+        journal を渡すと、成功済みの操作は記録された結果を返して再実行せず、
+        チャンネルごとに適用し終えた操作の結果を記録します。
+        """
+        results: Dict[Operation, str] = {}
+        groups: Dict[Tuple[str, str], List[Operation]] = defaultdict(list)
+        for op in plan:
+            completed = journal.completed(operation_key(op)) if journal else None
+            if completed:
+                results[op] = completed
+            else:
+                groups[(op.team, op.channel)].append(op)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for group_results in executor.map(
+                lambda item: self._apply_channel(channel_ids.get(item[0]), item[1], user_ids),
+                groups.items(),
+            ):
+                results.update(group_results)
+                if journal:
+                    for op, result in group_results.items():
+                        journal.record(operation_key(op), succeeded(result), result)
+        return results
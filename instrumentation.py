@@ -0,0 +1,171 @@
+import atexit  # 実行終了時にサマリーを出力するためのライブラリ
+import cProfile  # 実行全体のプロファイルを取るためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import math  # パーセンタイルの順位を切り上げるためのライブラリ
+import pstats  # スレッドごとのプロファイルを 1 つにまとめるためのライブラリ
+import re  # エンドポイントのパスからIDなどを取り除くための正規表現
+import sys
+import threading  # 複数スレッドからの同時記録に備えるためのライブラリ
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Mattermost のID（26文字の英数字）とメールアドレスです。
+ID_PATTERN = re.compile(r"^[a-z0-9]{26}$")
+EMAIL_PATTERN = re.compile(r"^[^/@]+@[^/@]+$")
+
+# 名前で検索するエンドポイントでは、直後の要素を {name} に置き換えます。
+NAME_SEGMENTS = {"name", "username", "email"}
+
+
+def endpoint_template(method: str, path: str) -> str:
+    """"/channels/abc.../members" を "GET /channels/{id}/members" のような形にします。"""
+    segments = path.split("?")[0].strip("/").split("/")
+    template = []
+    for i, segment in enumerate(segments):
+        if i > 0 and segments[i - 1] in NAME_SEGMENTS:
+            template.append("{name}")
+        elif ID_PATTERN.match(segment):
+            template.append("{id}")
+        elif EMAIL_PATTERN.match(segment):
+            template.append("{email}")
+        else:
+            template.append(segment)
+    return f"{method} /{'/'.join(template)}"
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    # 最近接順位法でパーセンタイルを求めます（順位は ratio * 件数 の切り上げです）。
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(ratio * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RequestMetrics:
+    """API 呼び出しごとのエンドポイント、ステータス、所要時間、バイト数、リトライ回数を記録します。"""
+
+    def __init__(self, slowest: int = 10) -> None:
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._bytes: Dict[str, int] = defaultdict(int)
+        self._retries: Dict[str, int] = defaultdict(int)
+        self._slowest_calls: List[Dict[str, Any]] = []
+
+    def record(
+        self, method: str, path: str, status: Any, latency: float, size: int, retries: int
+    ) -> None:
+        endpoint = endpoint_template(method, path)
+        with self._lock:
+            self._latencies[endpoint].append(latency)
+            self._statuses[endpoint][str(status)] += 1
+            self._bytes[endpoint] += size
+            self._retries[endpoint] += retries
+            if len(self._slowest_calls) < self.slowest or latency > self._slowest_calls[-1]["latency"]:
+                self._slowest_calls.append(
+                    {"method": method, "path": path, "status": status, "latency": latency, "retries": retries}
+                )
+                self._slowest_calls.sort(key=lambda call: -call["latency"])
+                del self._slowest_calls[self.slowest :]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for endpoint, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                endpoints[endpoint] = {
+                    "count": len(ordered),
+                    "statuses": dict(self._statuses[endpoint]),
+                    "total_seconds": sum(ordered),
+                    "p50": percentile(ordered, 0.50),
+                    "p95": percentile(ordered, 0.95),
+                    "p99": percentile(ordered, 0.99),
+                    "bytes": self._bytes[endpoint],
+                    "retries": self._retries[endpoint],
+                }
+            return {
+                "total_requests": sum(item["count"] for item in endpoints.values()),
+                "endpoints": dict(sorted(endpoints.items(), key=lambda item: -item[1]["total_seconds"])),
+                "slowest_calls": list(self._slowest_calls),
+            }
+
+    def format_table(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{'エンドポイント':<50} {'回数':>7} {'合計(s)':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'KiB':>9} {'リトライ':>6}"
+        ]
+        for endpoint, item in summary["endpoints"].items():
+            lines.append(
+                f"{endpoint:<50} {item['count']:>7} {item['total_seconds']:>9.2f} "
+                f"{item['p50'] * 1000:>9.1f} {item['p95'] * 1000:>9.1f} {item['p99'] * 1000:>9.1f} "
+                f"{item['bytes'] / 1024:>9.1f} {item['retries']:>6}"
+            )
+        lines.append(f"リクエスト数の合計: {summary['total_requests']}")
+        lines.append("最も時間のかかった呼び出し:")
+        for call in summary["slowest_calls"]:
+            lines.append(
+                f"  {call['latency'] * 1000:9.1f} ms  {call['status']}  {call['method']} {call['path']} (リトライ: {call['retries']})"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+# すべての MattermostClient が記録する、プロセス全体で共有の計測結果です。
+metrics = RequestMetrics()
+
+
+# start_run で終了時の出力を登録済みかどうかです。
+_run_started = False
+
+
+def start_run(config: Dict[str, Any]) -> None:
+    """config.json の設定に従い、実行終了時に計測結果とプロファイルを出力するよう登録します。
+
+    metrics_file を指定すると、エンドポイントごとの集計を表で表示し、JSON ファイルに書き出します。
+    profile_file を指定すると、実行全体の cProfile の結果をそのファイルに書き出します。
+    ThreadPoolExecutor などのワーカースレッドの処理も含めます。
+    mattermost-cli.py の --batch で複数回呼び出された場合は、最初の 1 回だけ登録し、
+    バッチ全体の計測結果を終了時にまとめて出力します。
+    """
+    global _run_started
+    if _run_started:
+        return
+    _run_started = True
+
+    profiler: Optional[cProfile.Profile] = None
+    thread_profilers: List[cProfile.Profile] = []
+    if config.get("profile_file"):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        # Python 3.11 までの cProfile は有効にしたスレッドだけを計測するため、以降に開始したスレッドごとに
+        # プロファイラーを作り、終了時にまとめます。3.12 以降は 1 つのプロファイラーで全スレッドを計測します。
+        if sys.version_info < (3, 12):
+            lock = threading.Lock()
+
+            def profile_thread(frame: Any, event: str, arg: Any) -> None:
+                thread_profiler = cProfile.Profile()
+                with lock:
+                    thread_profilers.append(thread_profiler)
+                thread_profiler.enable()
+
+            threading.setprofile(profile_thread)
+
+    def report() -> None:
+        if profiler:
+            profiler.disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(profiler)
+            for thread_profiler in thread_profilers:
+                stats.add(thread_profiler)
+            stats.dump_stats(config["profile_file"])
+            print(f"プロファイルを出力しました: {config['profile_file']}（スレッド数: {len(thread_profilers) + 1}）")
+        if config.get("metrics_file"):
+            print(metrics.format_table())
+            metrics.write_json(config["metrics_file"])
+            print(f"API呼び出しの計測結果を出力しました: {config['metrics_file']}")
+
+    atexit.register(report)
@@ -0,0 +1,89 @@
+from copy import copy  # 書式の参照を複製するための関数
+from openpyxl import Workbook  # Excelファイルを作成・操作するためのライブラリ
+from openpyxl.cell import WriteOnlyCell  # 書き込み専用モードで書式付きのセルを作るためのクラス
+from openpyxl.styles import NamedStyle, PatternFill, Protection  # Excelのセルの書式を共有するためのクラス
+from openpyxl.utils import get_column_letter  # 数値をExcelの列のアルファベット（例：1 -> 'A'）に変換するための関数
+from typing import Any, Dict
+from membership_index import MembershipIndex  # ユーザーとチャンネルを番号で保持する参加状況の索引
+
+# ユーザー名の列とチャンネル名の列の幅です（既定の幅 13 の 2 倍）。
+WIDE_COLUMN_WIDTH = 26
+
+
+def _named_styles() -> Dict[str, NamedStyle]:
+    # 書式はセルごとに作らず、名前付きスタイルとしてブックで共有します。
+    grey_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    alternate_fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+    return {
+        "user": NamedStyle(name="user"),
+        "user_alt": NamedStyle(name="user_alt", fill=alternate_fill),
+        "channel": NamedStyle(name="channel", fill=grey_fill, protection=Protection(locked=True)),
+        "instruction": NamedStyle(name="instruction", protection=Protection(locked=False)),
+        "instruction_alt": NamedStyle(
+            name="instruction_alt", fill=alternate_fill, protection=Protection(locked=False)
+        ),
+    }
+
+
+class StyledCellFactory:
+    """書き込み専用モードのシートに、名前付きスタイルを付けたセルを作ります。
+
+    名前付きスタイルの割り当ては 1 回ずつに留め、以降のセルには書式の参照だけをコピーします。
+    スタイルはあらかじめブックに add_named_style で登録しておきます。ブックごとに作成してください。
+    """
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, Any] = {}
+
+    def cell(self, ws: Any, value: Any, style_name: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
+        if style_name not in self._templates:
+            cell.style = style_name
+            self._templates[style_name] = cell._style
+        cell._style = copy(self._templates[style_name])
+        return cell
+
+
+def write_membership_matrix(path: str, index: MembershipIndex) -> None:
+    """チームごとのシートに参加状況の表を書き出します。
+
+    書き込み専用モードで 1 行ずつ書式を付けて書き出すため、表全体をメモリに保持しません。
+    チャンネル名の列は灰色で保護し、"(指示)" の列のみ編集可能にします。
+    データ行は 1 行おきに背景色を付けます。
+    """
+    wb = Workbook(write_only=True)
+    styles = _named_styles()
+    for style in styles.values():
+        wb.add_named_style(style)
+
+    styled = StyledCellFactory().cell
+
+    for position, (team, channel_numbers) in enumerate(index.teams):
+        # 新しいシートを作成し、チーム名を設定します。
+        ws = wb.create_sheet(title=team)
+        channels = [index.channel_names[number] for number in channel_numbers]
+
+        # 列幅、固定する行と列、シートの保護は行を書き出す前に設定します。
+        ws.column_dimensions["A"].width = WIDE_COLUMN_WIDTH
+        for i in range(len(channels)):
+            ws.column_dimensions[get_column_letter(i * 2 + 2)].width = WIDE_COLUMN_WIDTH
+        ws.freeze_panes = "B2"
+        ws.protection.sheet = True
+
+        # 列名を書き込みます。
+        header = [styled(ws, "ユーザー名", "user")]
+        for channel in channels:
+            header.append(styled(ws, channel, "channel"))
+            header.append(styled(ws, "(指示)", "instruction"))
+        ws.append(header)
+
+        # 各ユーザーの参加状況を書き出します。
+        for row_number, (username, statuses) in enumerate(index.team_rows(position), start=2):
+            alternate = row_number % 2 == 0
+            row = [styled(ws, username, "user_alt" if alternate else "user")]
+            for status in statuses:
+                row.append(styled(ws, status, "channel"))
+                row.append(styled(ws, status, "instruction_alt" if alternate else "instruction"))
+            ws.append(row)
+
+    wb.save(path)
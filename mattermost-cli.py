@@ -0,0 +1,110 @@
+import argparse  # コマンドライン引数を扱うためのライブラリ
+import os  # スクリプトのパスを扱うためのライブラリ
+import runpy  # サブコマンドのスクリプトを同じプロセスで実行するためのライブラリ
+import shlex  # --batch のファイルの各行を引数に分けるためのライブラリ
+import sys
+import time  # 各処理の所要時間を測るためのライブラリ
+from typing import List, Optional
+from app_config import set_config_path  # 設定ファイルをプロセスで一度だけ読み込む関数
+
+# サブコマンドと、そのサブコマンドで実行するスクリプトです。
+# スクリプトは実行するときに初めて読み込むため、pandas や openpyxl は必要なサブコマンドでのみ読み込まれます。
+COMMANDS = {
+    "register": "register_users.py",
+    "export-matrix": "mattermost-current-user-list.py",
+    "apply-instructions": "mattermost-user-management.py",
+    "last-message": "output_last_message.py",
+}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_command(command: str, arguments: List[str]) -> int:
+    """サブコマンドのスクリプトを、引数を渡して同じプロセスで実行し、終了コードを返します。"""
+    if command not in COMMANDS:
+        print(f"不明なサブコマンドです: {command} (使用できるもの: {', '.join(COMMANDS)})")
+        return 2
+    script = os.path.join(SCRIPT_DIR, COMMANDS[command])
+    saved_argv = sys.argv
+    sys.argv = [script] + arguments
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        # スクリプトの sys.exit と argparse のエラーは、その処理の終了コードとして扱います。
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code)
+        return 1
+    finally:
+        sys.argv = saved_argv
+    return 0
+
+
+def read_batch(path: str) -> List[List[str]]:
+    """--batch のファイルから、1 行 1 件の処理を読み込みます。空行と # で始まる行は無視します。"""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [shlex.split(line) for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch(path: str, keep_going: bool) -> int:
+    """--batch のファイルの処理を 1 つのプロセスで順に実行します。
+
+    設定ファイルの読み込みと各ライブラリの読み込みは最初の 1 回だけです。
+    keep_going が False の場合は、失敗した処理があればそこで止めます。
+    """
+    operations = read_batch(path)
+    failures = 0
+    start_time = time.perf_counter()
+    for number, operation in enumerate(operations, 1):
+        print(f"[{number}/{len(operations)}] {shlex.join(operation)}")
+        operation_start = time.perf_counter()
+        try:
+            code = run_command(operation[0], operation[1:])
+        except Exception as e:
+            print(f"処理中にエラーが発生しました: {e}")
+            code = 1
+        print(f"[{number}/{len(operations)}] 終了コード: {code} (所要時間: {time.perf_counter() - operation_start:.2f} 秒)")
+        if code:
+            failures += 1
+            if not keep_going:
+                break
+    print(
+        f"バッチの処理が完了しました (件数: {len(operations)}, 失敗: {failures}, 所要時間: {time.perf_counter() - start_time:.2f} 秒)"
+    )
+    return 1 if failures else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Mattermost のユーザー管理の各処理を 1 つのコマンドから実行します",
+        epilog="サブコマンドの引数は各スクリプトと同じです（例: %(prog)s register --help）",
+    )
+    parser.add_argument("--config", default="config.json", help="設定ファイル（既定値: config.json）")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="1 行 1 件の処理（例: last-message --stats）を記載したファイルを 1 つのプロセスで順に実行します（- で標準入力）",
+    )
+    parser.add_argument(
+        "--keep-going", action="store_true", help="--batch で失敗した処理があっても、残りの処理を続けます"
+    )
+    parser.add_argument("command", nargs="?", choices=list(COMMANDS), help="実行する処理")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help="処理に渡す引数")
+    args = parser.parse_args(argv)
+
+    set_config_path(args.config)
+    if args.batch:
+        if args.command:
+            parser.error("--batch とサブコマンドは同時に指定できません")
+        return run_batch(args.batch, args.keep_going)
+    if not args.command:
+        parser.error("サブコマンドまたは --batch を指定してください")
+    return run_command(args.command, args.arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
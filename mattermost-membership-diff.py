@@ -0,0 +1,59 @@
+import argparse  # コマンドライン引数を扱うためのライブラリ
+import os  # ファイルの有無を確認するためのライブラリ
+import sqlite3  # スナップショットを開けなかった場合のエラーを扱うためのライブラリ
+import sys
+from membership_diff import ADDED, REMOVED, diff_indexes, group_by_team, write_csv, write_excel, write_json  # スナップショット間の差分を求めて書き出す関数
+from snapshot_store import SnapshotStore  # 参加状況のスナップショットを保存するローカルのストア
+
+parser = argparse.ArgumentParser(
+    description="保存済みの 2 つのスナップショットを比較し、参加・退出したユーザーとチャンネルの組を書き出します"
+)
+parser.add_argument("old", help="比較元のスナップショット（SQLite ファイル）")
+parser.add_argument("new", help="比較先のスナップショット（SQLite ファイル）")
+parser.add_argument("--csv", help="変更の一覧を書き出す CSV ファイル")
+parser.add_argument("--json", help="チームごとの変更を書き出す JSON ファイル")
+parser.add_argument("--excel", help="変更の一覧を色分けして書き出す Excel ファイル")
+args = parser.parse_args()
+
+# サーバーには接続せず、保存済みのスナップショットだけを読み取り専用で読み込みます。
+# パスを間違えても空のファイルを作らないよう、存在しないファイルはエラーにします。
+snapshots = []
+for path in (args.old, args.new):
+    if not os.path.isfile(path):
+        print(f"スナップショットのファイルが見つかりません: {path}")
+        sys.exit(1)
+    try:
+        store = SnapshotStore(path, readonly=True)
+        snapshot = store.load()
+        refreshed_at = store.refreshed_at()
+        store.close()
+    except sqlite3.Error as e:
+        print(f"スナップショットを読み込めませんでした: {path} ({e})")
+        sys.exit(1)
+    if snapshot is None:
+        print(f"スナップショットが保存されていません: {path}")
+        sys.exit(1)
+    snapshots.append((snapshot.index(), refreshed_at))
+
+(old_index, old_refreshed_at), (new_index, new_refreshed_at) = snapshots
+changes = diff_indexes(old_index, new_index)
+
+print(f"比較元: {args.old} (取得日時: {old_refreshed_at})")
+print(f"比較先: {args.new} (取得日時: {new_refreshed_at})")
+for team, team_changes in group_by_team(changes).items():
+    print(f"{team}: 参加 {len(team_changes[ADDED])} 件, 退出 {len(team_changes[REMOVED])} 件")
+print(f"変更の合計: {len(changes)} 件")
+
+if args.csv:
+    write_csv(args.csv, changes)
+    print(f"CSVファイルを保存しました: {args.csv}")
+if args.json:
+    write_json(
+        args.json,
+        changes,
+        {"old": {"path": args.old, "refreshed_at": old_refreshed_at}, "new": {"path": args.new, "refreshed_at": new_refreshed_at}},
+    )
+    print(f"JSONファイルを保存しました: {args.json}")
+if args.excel:
+    write_excel(args.excel, changes)
+    print(f"エクセルファイルを保存しました: {args.excel}")
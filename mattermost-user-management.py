@@ -1,26 +1,71 @@
 import os
+import argparse
+import asyncio
 import json
-import requests
 import sys
-from openpyxl import load_workbook
 from urllib.parse import quote
+from app_config import load_config
+from instrumentation import start_run
+from mattermost_api import MattermostClient
+import mattermost_async
+from resolution_cache import ResolutionCache, UserResolver
+from instruction_plan import Operation, PlanExecutor, build_plan, classify, format_plan, iter_sheet_rows, operation_key
+from checkpoint import CheckpointJournal, file_fingerprint
+from membership_applier import BulkMembershipApplier
 
 # 設定ファイルを読み込みます。
 try:
-    with open("config.json") as f:
-        config = json.load(f)
+    config = load_config()
 except (FileNotFoundError, json.JSONDecodeError) as e:
     print(f"設定ファイルの読み込みに失敗しました: {e}")
     sys.exit(1)
 
+parser = argparse.ArgumentParser(description="Excelの指示内容に従ってチャンネルの参加状況を変更します")
+parser.add_argument(
+    "--plan-only", action="store_true", help="サーバーに接続せず、変更計画のみを表示します"
+)
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=config.get("concurrency", 4),
+    help="同時に処理するチャンネル数",
+)
+parser.add_argument(
+    "--async",
+    dest="use_async",
+    action="store_true",
+    help="チームとチャンネルの一覧を aiohttp による非同期の通信でまとめて取得します",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="前回のジャーナルを読み込み、成功済みの操作を飛ばして失敗した操作と未処理の操作のみ適用します",
+)
+parser.add_argument(
+    "--journal",
+    default=config.get(
+        "management_journal", os.path.join(config["excel_dir"], "mattermost-user-management.journal.jsonl")
+    ),
+    help="適用した操作を記録するジャーナルファイル",
+)
+args = parser.parse_args()
+
+# openpyxl は読み込みに時間がかかるため、--help や引数の誤りでは読み込まず、引数の解析後に読み込みます。
+from openpyxl import load_workbook
+
+# config.json の metrics_file / profile_file を指定すると、終了時に計測結果を出力します。
+start_run(config)
+
 # Mattermost のエンドポイントとアクセストークンを設定します。
 url = config["url"]
 token = config["token"]
-headers = {"Authorization": f"Bearer {token}"}
+client = MattermostClient.from_config(config)
+cache = ResolutionCache.from_config(config)
+resolver = UserResolver(client)
 
-# Excelファイルを読み込みます。
+# Excelファイルを読み取り専用モードで読み込みます（行を順に読み、シート全体をメモリに展開しません）。
 workbook_path = os.path.join(config["excel_dir"], config["excel_file"])
-wb = load_workbook(workbook_path)
+wb = load_workbook(workbook_path, read_only=True)
 
 # 出力ファイルを作成します。
 output_file_path1 = os.path.join(config["excel_dir"], "output_all.txt")
@@ -28,11 +73,7 @@ output_file_path2 = os.path.join(config["excel_dir"], "output_changes_only.txt")
 
 
 def get_team_id_by_name(team_name):
-    response = requests.post(
-        f"{url}/api/v4/teams/search",
-        headers=headers,
-        json={"term": team_name},
-    )
+    response = client.post("/teams/search", json={"term": team_name})
 
     response.raise_for_status()
 
@@ -50,50 +91,113 @@ def get_team_id_by_name(team_name):
 
 def create_channel_mapping(team_id):
     # パブリックチャンネルを取得
-    public_channels_response = requests.get(
-        f"{url}/api/v4/teams/{team_id}/channels", headers=headers
-    )
-    public_channels_response.raise_for_status()
+    public_channels_data = client.iter_pages(f"/teams/{team_id}/channels")
 
-    # パブリックチャンネルを取得
-    private_channels_response = requests.get(
-        f"{url}/api/v4/users/me/teams/{team_id}/channels", headers=headers
-    )
+    # プライベートチャンネルを取得
+    private_channels_response = client.get(f"/users/me/teams/{team_id}/channels")
     private_channels_response.raise_for_status()
 
     try:
-        public_channels_data = public_channels_response.json()
         private_channels_data = private_channels_response.json()
-        channels_data = public_channels_data + private_channels_data
     except ValueError:
-        print(
-            f"チーム {team_id} のJSONデータ解析エラー: {public_channels_response.text} {private_channels_response.text}"
-        )
+        print(f"チーム {team_id} のJSONデータ解析エラー: {private_channels_response.text}")
         return {}
 
-    if not isinstance(channels_data, list):
-        print(f"channels_dataの形式が予期せぬものです: {channels_data}")
+    if not isinstance(private_channels_data, list):
+        print(f"channels_dataの形式が予期せぬものです: {private_channels_data}")
         return {}
 
-    return {channel["display_name"]: channel["id"] for channel in channels_data}
+    channel_mapping = {channel["display_name"]: channel["id"] for channel in public_channels_data}
+    channel_mapping.update(
+        {channel["display_name"]: channel["id"] for channel in private_channels_data}
+    )
+    return channel_mapping
 
 
+def resolve_team_id(team_name):
+    # チームIDはキャッシュし、シートごとの2回の処理で一度だけ問い合わせます。
+    return cache.get_or_resolve(
+        "team_search", team_name, lambda: get_team_id_by_name(team_name)
+    )
+
+
+def resolve_channel_mapping(team_id):
+    # 取得に失敗した空のマッピングはキャッシュしません。
+    return (
+        cache.get_or_resolve(
+            "channel_mapping", team_id, lambda: create_channel_mapping(team_id) or None
+        )
+        or {}
+    )
+
+
+async def resolve_sheets_async(sheet_names):
+    # --async では、全シートのチームIDとチャンネルの一覧を 1 つのイベントループで並行して取得します。
+    async with mattermost_async.AsyncMattermostClient.from_config(config) as async_client:
+
+        async def resolve_sheet(sheet_name):
+            team_id = await cache.get_or_resolve_async(
+                "team_search", sheet_name, lambda: mattermost_async.get_team_id_by_name(async_client, sheet_name)
+            )
+            if not team_id:
+                return team_id, {}
+
+            async def create_channel_mapping_or_none():
+                # 取得に失敗した空のマッピングはキャッシュしません。
+                return await mattermost_async.create_channel_mapping(async_client, team_id) or None
+
+            channel_mapping = await cache.get_or_resolve_async("channel_mapping", team_id, create_channel_mapping_or_none)
+            return team_id, channel_mapping or {}
+
+        return dict(zip(sheet_names, await asyncio.gather(*(resolve_sheet(name) for name in sheet_names))))
+
+
+# ワークブックから変更計画を作成します。
+plan = build_plan(wb)
+if args.plan_only:
+    print(format_plan(plan))
+    wb.close()
+    sys.exit(0)
+
 # Output API responses to a text file
 api_responses_file_path = os.path.join(config["excel_dir"], "api_responses.txt")
 
+channel_ids = {}
+resolved_sheets = asyncio.run(resolve_sheets_async(wb.sheetnames)) if args.use_async else {}
 with open(api_responses_file_path, "w", encoding="utf-8") as api_responses_file:
     for sheet_name in wb.sheetnames:
-        team_id = get_team_id_by_name(sheet_name)
+        if args.use_async:
+            team_id, channel_mapping = resolved_sheets[sheet_name]
+        else:
+            team_id = resolve_team_id(sheet_name)
+            channel_mapping = resolve_channel_mapping(team_id)
         api_responses_file.write(f"Team: {sheet_name} - Team ID: {team_id}\n")
 
-        channel_mapping = create_channel_mapping(team_id)
         for channel_name, channel_id in channel_mapping.items():
             api_responses_file.write(
                 f"Channel: {channel_name} - Channel ID: {channel_id}\n"
             )
+            channel_ids[(sheet_name, channel_name)] = channel_id
         api_responses_file.write("\n")
 
 
+# 適用した操作をジャーナルに記録します（--resume では成功済みの操作を飛ばします）。
+journal = CheckpointJournal(args.journal, file_fingerprint(workbook_path), resume=args.resume)
+pending = [op for op in plan if not journal.completed(operation_key(op))]
+
+# 未適用の変更のあるユーザー名をまとめて問い合わせ、ユーザーIDを一括で取得します。
+resolver.prefetch_usernames(op.username for op in pending)
+user_ids = {op.username: resolver.id_for_username(op.username) for op in pending}
+
+# 変更計画をチャンネル単位で並行して適用します。
+try:
+    results = PlanExecutor(
+        client, concurrency=args.concurrency, applier=BulkMembershipApplier(client, cache)
+    ).execute(plan, channel_ids, user_ids, journal)
+finally:
+    journal.close()
+print(journal.summary())
+
 with open(output_file_path1, "w", encoding="utf-8") as output_file1, open(
     output_file_path2, "w", encoding="utf-8"
 ) as output_file2:
@@ -111,64 +215,21 @@ with open(output_file_path1, "w", encoding="utf-8") as output_file1, open(
         output_file1.write(f"{separator_line}\n\n")
         output_file2.write(f"{separator_line}\n\n")
 
-        # チームIDとチャンネルマッピングを取得
-        team_id = get_team_id_by_name(sheet_name)
-        channel_mapping = create_channel_mapping(team_id)
-
-        # 各シートの各行について処理を行います。
-        for row in ws.iter_rows(min_row=2):
-            username = row[0].value
-
-            # ユーザー名からユーザーIDを取得します。
-            user_response = requests.get(
-                f"{url}/api/v4/users/username/{username}", headers=headers
-            )
-            user_data = user_response.json()
-            user_id = user_data["id"]
-
+        # 各シートの各行について、適用結果を出力します。
+        for username, cells in iter_sheet_rows(ws):
             # ユーザー毎に各チャンネルへの参加状況と指示内容を出力します。
             output_file1.write(f"ユーザー名: {username}\n")
             has_changes = False
             changes_output = []
 
-            for col_idx in range(1, len(row), 2):
-                channel_name = ws.cell(row=1, column=col_idx + 1).value
-                current_status = row[col_idx].value
-                next_status = row[col_idx + 1].value
+            for channel_name, current_status, next_status in cells:
+                status_change, action = classify(current_status, next_status)
                 api_result = ""
-
-                # 現在の参加状況と指示が同じかどうかを判断し、出力する内容を決定します。
-                if current_status == next_status:
-                    status_change = "変更なし"
-                else:
-                    channel_id = channel_mapping[channel_name]
-
-                    if next_status == "〇":
-                        status_change = "招待"
-                        # Mattermost API でユーザーを該当のチームのチャンネルにJOINさせる
-                        join_response = requests.post(
-                            f"{url}/api/v4/channels/{channel_id}/members",
-                            headers=headers,
-                            json={"user_id": user_id},
-                        )
-                        api_result = (
-                            f"API結果: {join_response.status_code} {join_response.text}"
-                        )
-
-                    elif current_status == "〇":
-                        status_change = "退会"
-                        # Mattermost API でユーザーを該当のチームのチャンネルからleaveする
-                        leave_response = requests.delete(
-                            f"{url}/api/v4/channels/{channel_id}/members/{user_id}",
-                            headers=headers,
-                        )
-                        api_result = (
-                            f"API結果: {leave_response.status_code} {leave_response.text}"
-                        )
-
-                    else:
-                        status_change = f"{current_status} -> {next_status}"
-
+                if action:
+                    api_result = results.get(
+                        Operation(sheet_name, channel_name, str(username), action), ""
+                    )
+                if status_change != "変更なし":
                     has_changes = True
 
                 # 参加状況と指示内容をわかりやすく出力します。
@@ -186,5 +247,8 @@ with open(output_file_path1, "w", encoding="utf-8") as output_file1, open(
 
             output_file1.write("\n")
 
+wb.close()
+cache.save()
+
 print(f"テキストファイルに処理内容を出力しました: {output_file_path1}")
 print(f"変更があったユーザーのみを出力したテキストファイルを作成しました: {output_file_path2}")
@@ -0,0 +1,149 @@
+import threading  # 複数スレッドからの同時利用に備えるためのライブラリ
+import time  # リトライ待ちとレート制限の待機に使うライブラリ
+import requests  # HTTPリクエストを送るためのライブラリ
+from requests.adapters import HTTPAdapter  # コネクションプールの大きさを設定するためのアダプター
+from typing import Any, Dict, Iterator, Optional
+from instrumentation import RequestMetrics, metrics  # API 呼び出しごとの計測結果
+
+# Mattermost API が 1 ページで返せる最大件数です。
+PER_PAGE = 200
+
+# リトライ対象とするステータスコードです。
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 5xx、接続エラー、タイムアウトでリトライするメソッドです。
+# POST はサーバーで処理が済んでいる場合があるため（ユーザーの作成など）、429 でのみリトライします。
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+def is_retryable(method: str, status: Optional[int]) -> bool:
+    """リトライしてよいかを返します。status が None の場合は接続エラーかタイムアウトです。"""
+    if status == 429:
+        return True
+    return method.upper() in IDEMPOTENT_METHODS and (status is None or status in RETRY_STATUSES)
+
+
+class MattermostClient:
+    """各スクリプトで共有する Mattermost API クライアントです。
+
+    一覧系のエンドポイントは iter_pages でページ単位に取得し、要素を順に返します。
+    全件をメモリに読み込まないため、ユーザー数が増えてもメモリ使用量は一定です。
+
+    通信は 1 つの requests.Session で行い、接続を使い回します。
+    429 は指数バックオフ（Retry-After があればその秒数）でリトライします。5xx、接続エラー、
+    timeout 秒のタイムアウトは、GET や DELETE などの冪等なメソッドのみリトライします。
+    X-RateLimit-Remaining が 0 になったら、X-RateLimit-Reset の秒数だけ次のリクエストを待ちます。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        pool_size: int = 10,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 30.0,
+        request_metrics: Optional[RequestMetrics] = None,
+    ) -> None:
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.request_count = 0
+        self.metrics = request_metrics or metrics
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "MattermostClient":
+        return cls(
+            config["url"],
+            config["token"],
+            pool_size=config.get("pool_size", 10),
+            max_retries=config.get("max_retries", 5),
+            backoff_factor=config.get("backoff_factor", 0.5),
+            timeout=config.get("timeout", 30.0),
+        )
+
+    def _wait_for_rate_limit(self) -> None:
+        with self._lock:
+            delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _update_rate_limit(self, response: requests.Response) -> None:
+        # 残りリクエスト数が 0 になったら、リセットまで次のリクエストを止めます。
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None or int(remaining) > 0:
+            return
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + float(reset))
+
+    def _retry_delay(self, response: Optional[requests.Response], attempt: int) -> float:
+        if response is not None and response.headers.get("Retry-After"):
+            return float(response.headers["Retry-After"])
+        return self.backoff_factor * (2**attempt)
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        start = time.perf_counter()
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            with self._lock:
+                self.request_count += 1
+
+            try:
+                response = self.session.request(method, f"{self.url}/api/v4{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not is_retryable(method, None) or attempt == self.max_retries:
+                    self.metrics.record(method, path, "error", time.perf_counter() - start, 0, attempt)
+                    raise
+                time.sleep(self._retry_delay(None, attempt))
+                continue
+
+            self._update_rate_limit(response)
+            if not is_retryable(method, response.status_code) or attempt == self.max_retries:
+                self.metrics.record(
+                    method,
+                    path,
+                    response.status_code,
+                    time.perf_counter() - start,
+                    len(response.content),
+                    attempt,
+                )
+                return response
+            time.sleep(self._retry_delay(response, attempt))
+
+    def get(
+        self, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> requests.Response:
+        return self.request("GET", path, params=params)
+
+    def post(self, path: str, json: Any = None) -> requests.Response:
+        return self.request("POST", path, json=json)
+
+    def delete(self, path: str) -> requests.Response:
+        return self.request("DELETE", path)
+
+    def iter_pages(
+        self, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        # ページを順に取得し、件数が PER_PAGE 未満になったら終了します。
+        page = 0
+        while True:
+            response = self.get(path, {**(params or {}), "page": page, "per_page": PER_PAGE})
+            response.raise_for_status()
+            items = response.json()
+            yield from items
+            if len(items) < PER_PAGE:
+                return
+            page += 1
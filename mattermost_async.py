@@ -0,0 +1,332 @@
+import asyncio  # 非同期にリクエストを送るためのライブラリ
+import datetime  # 日時を扱うためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import logging  # 処理状況を出力するためのライブラリ
+import time  # リトライ待ちとレート制限の待機に使うライブラリ
+import requests  # 同期版と同じ例外（requests.HTTPError）を送出するためのライブラリ
+from typing import Any, AsyncIterator, Dict, List, Optional
+from instrumentation import RequestMetrics, metrics  # API 呼び出しごとの計測結果
+from mattermost_api import PER_PAGE, is_retryable  # 同期版のクライアントと共通の設定
+from resolution_cache import UserResolver  # 一括取得したユーザーの対応表
+
+# 非同期の HTTP クライアントです。読み込みに時間がかかるため、--async を指定して
+# AsyncMattermostClient を作成したときに初めて読み込みます。
+aiohttp: Any = None
+
+logger = logging.getLogger(__name__)
+
+
+def _import_aiohttp() -> None:
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp as module
+        except ImportError:
+            raise RuntimeError("--async を使うには aiohttp をインストールしてください (pip install aiohttp)")
+        aiohttp = module
+
+
+class AsyncResponse:
+    """requests.Response と同じ名前で、ステータス、本文、ヘッダーを参照できる応答です。"""
+
+    def __init__(self, status_code: int, content: bytes, headers: Dict[str, str], url: str = "") -> None:
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        # 同期版と同じく requests.HTTPError を送出し、e.response でステータスと本文を参照できるようにします。
+        if self.status_code >= 400:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise requests.HTTPError(
+                f"{self.status_code} {kind} Error for url: {self.url}: {self.text}", response=self
+            )
+
+
+class AsyncMattermostClient:
+    """MattermostClient と同じ使い方ができる、asyncio 版の Mattermost API クライアントです。
+
+    同時に送るリクエスト数は全体で concurrency 件までに制限し、接続はホストあたり
+    per_host_limit 本までに制限します。429 と 5xx のリトライ（POST は 429 のみ）、タイムアウト、
+    X-RateLimit による待機、計測結果の記録は MattermostClient と同じです。
+
+    async with で使い、終了時に接続を閉じます。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        concurrency: int = 32,
+        per_host_limit: int = 16,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 30.0,
+        request_metrics: Optional[RequestMetrics] = None,
+    ) -> None:
+        _import_aiohttp()
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.concurrency = concurrency
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.request_count = 0
+        self.metrics = request_metrics or metrics
+        self.session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], concurrency: Optional[int] = None) -> "AsyncMattermostClient":
+        return cls(
+            config["url"],
+            config["token"],
+            concurrency=concurrency or config.get("async_concurrency", 32),
+            per_host_limit=config.get("async_per_host", 16),
+            max_retries=config.get("max_retries", 5),
+            backoff_factor=config.get("backoff_factor", 0.5),
+            timeout=config.get("timeout", 30.0),
+        )
+
+    async def __aenter__(self) -> "AsyncMattermostClient":
+        # セマフォとセッションはイベントループの中で作ります。
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            # セマフォの待ち時間を含めないよう、1 回のリクエストの時間だけを制限します。
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            # 全体の接続数の上限は、ホストあたりの上限を下回らないようにします。
+            connector=aiohttp.TCPConnector(
+                limit=max(self.concurrency, self.per_host_limit), limit_per_host=self.per_host_limit
+            ),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.session.close()
+
+    async def _wait_for_rate_limit(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _update_rate_limit(self, response: AsyncResponse) -> None:
+        # 残りリクエスト数が 0 になったら、リセットまで次のリクエストを止めます。
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None or int(remaining) > 0:
+            return
+        self._paused_until = max(self._paused_until, time.monotonic() + float(reset))
+
+    def _retry_delay(self, response: Optional[AsyncResponse], attempt: int) -> float:
+        if response is not None and response.headers.get("Retry-After"):
+            return float(response.headers["Retry-After"])
+        return self.backoff_factor * (2**attempt)
+
+    async def _send(self, method: str, path: str, **kwargs: Any) -> AsyncResponse:
+        async with self._semaphore:
+            async with self.session.request(method, f"{self.url}/api/v4{path}", **kwargs) as response:
+                return AsyncResponse(response.status, await response.read(), dict(response.headers), str(response.url))
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> AsyncResponse:
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_rate_limit()
+            self.request_count += 1
+
+            try:
+                response = await self._send(method, path, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not is_retryable(method, None) or attempt == self.max_retries:
+                    self.metrics.record(method, path, "error", time.perf_counter() - start, 0, attempt)
+                    raise
+                await asyncio.sleep(self._retry_delay(None, attempt))
+                continue
+
+            self._update_rate_limit(response)
+            if not is_retryable(method, response.status_code) or attempt == self.max_retries:
+                self.metrics.record(
+                    method,
+                    path,
+                    response.status_code,
+                    time.perf_counter() - start,
+                    len(response.content),
+                    attempt,
+                )
+                return response
+            await asyncio.sleep(self._retry_delay(response, attempt))
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> AsyncResponse:
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path: str, json: Any = None) -> AsyncResponse:
+        return await self.request("POST", path, json=json)
+
+    async def delete(self, path: str) -> AsyncResponse:
+        return await self.request("DELETE", path)
+
+    async def iter_pages(
+        self, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # ページを順に取得し、件数が PER_PAGE 未満になったら終了します。
+        page = 0
+        while True:
+            response = await self.get(path, {**(params or {}), "page": page, "per_page": PER_PAGE})
+            response.raise_for_status()
+            items = response.json()
+            for item in items:
+                yield item
+            if len(items) < PER_PAGE:
+                return
+            page += 1
+
+
+# 以下は各スクリプトの同名の関数の非同期版です。
+
+async def get_user_by_email(client: AsyncMattermostClient, email: str) -> Optional[str]:
+    response = await client.get(f"/users/email/{email}")
+    if response.status_code == 200:
+        return response.json()["id"]
+    elif response.status_code == 404:
+        logger.info(f"No user with email {email} found")
+        return None
+    else:
+        logger.error(f"Error searching for user with email {email}: {response.text}")
+        return None
+
+
+async def create_user(
+    client: AsyncMattermostClient, user_data: Dict[str, str], resolver: Optional[UserResolver] = None
+) -> Optional[str]:
+    # resolver で一括取得済みのメールアドレスは、サーバーに問い合わせません。
+    cached, existing_user_id = resolver.cached_email(user_data["email"]) if resolver else (False, None)
+    if not cached:
+        existing_user_id = await get_user_by_email(client, user_data["email"])
+    if existing_user_id:
+        logger.info(f"User {user_data['email']} already exists")
+        return existing_user_id
+
+    response = await client.post("/users", json=user_data)
+    if response.status_code == 201:
+        logger.info(f"User {user_data['email']} created successfully")
+        if resolver:
+            resolver.add(response.json())
+        return response.json()["id"]
+    logger.error(f"Error creating user {user_data['email']}: {response.text}")
+    return None
+
+
+async def get_team_id(client: AsyncMattermostClient, team_name: str) -> Optional[str]:
+    response = await client.get(f"/teams/name/{team_name}")
+    if response.status_code == 200:
+        return response.json()["id"]
+    elif response.status_code == 404:
+        logger.warning(f"Team {team_name} does not exist")
+        return None
+    logger.error(f"Error getting team ID for {team_name}: {response.text}")
+    return None
+
+
+async def get_channel_id(client: AsyncMattermostClient, team_id: str, channel_name: str) -> Optional[str]:
+    response = await client.get(f"/teams/{team_id}/channels/name/{channel_name}")
+    if response.status_code == 200:
+        return response.json()["id"]
+    elif response.status_code == 404:
+        logger.warning(f"Channel {channel_name} does not exist")
+        return None
+    logger.error(f"Error getting channel ID for {channel_name}: {response.text}")
+    return None
+
+
+async def add_user_to_team(client: AsyncMattermostClient, user_id: str, team_id: str) -> bool:
+    response = await client.post(f"/teams/{team_id}/members", json={"user_id": user_id, "team_id": team_id})
+    if response.status_code == 201:
+        logger.info(f"User {user_id} added to team {team_id}")
+        return True
+    logger.error(f"Error adding user {user_id} to team {team_id}: {response.text}")
+    return False
+
+
+async def add_user_to_channel(client: AsyncMattermostClient, user_id: str, channel_id: str) -> bool:
+    response = await client.post(f"/channels/{channel_id}/members", json={"user_id": user_id})
+    if response.status_code == 201:
+        logger.info(f"User {user_id} added to channel {channel_id}")
+        return True
+    logger.error(f"Error adding user {user_id} to channel {channel_id}: {response.text}")
+    return False
+
+
+async def get_all_teams(client: AsyncMattermostClient) -> List[Dict[str, Any]]:
+    return [team async for team in client.iter_pages("/teams")]
+
+
+async def get_channels_for_team(client: AsyncMattermostClient, team_id: str) -> List[Dict[str, Any]]:
+    private_channels_response = await client.get(f"/users/me/teams/{team_id}/channels")
+    private_channels_response.raise_for_status()
+    channels = [channel async for channel in client.iter_pages(f"/teams/{team_id}/channels")]
+    channels += private_channels_response.json()
+
+    # 重複とチャンネル名が空のものを除外します。
+    channels = [channel for channel in channels if channel["display_name"].strip() != ""]
+    return list({channel["id"]: channel for channel in channels}.values())
+
+
+async def get_last_message_info(client: AsyncMattermostClient, channel_id: str) -> Optional[datetime.datetime]:
+    response = await client.get(f"/channels/{channel_id}/posts", params={"page": 0, "per_page": 1})
+    response.raise_for_status()
+
+    try:
+        posts_data = response.json()
+        if not posts_data["order"]:
+            print(f"チャンネルID '{channel_id}'にメッセージが見つかりませんでした")
+            return None
+    except ValueError:
+        print(f"チャンネル {channel_id} のJSONデータ解析エラー: {response.text}")
+        return None
+
+    last_post = posts_data["posts"][posts_data["order"][0]]
+    return datetime.datetime.fromtimestamp(last_post["create_at"] / 1000.0)
+
+
+async def get_team_id_by_name(client: AsyncMattermostClient, team_name: str) -> Optional[str]:
+    response = await client.post("/teams/search", json={"term": team_name})
+    response.raise_for_status()
+
+    try:
+        teams_data = response.json()
+        if not teams_data:
+            print(f"'{team_name}'という名前のチームが見つかりませんでした")
+            return None
+    except ValueError:
+        print(f"チーム {team_name} のJSONデータ解析エラー: {response.text}")
+        return None
+    return teams_data[0]["id"]
+
+
+async def create_channel_mapping(client: AsyncMattermostClient, team_id: str) -> Dict[str, str]:
+    public_channels = [channel async for channel in client.iter_pages(f"/teams/{team_id}/channels")]
+    private_channels_response = await client.get(f"/users/me/teams/{team_id}/channels")
+    private_channels_response.raise_for_status()
+
+    try:
+        private_channels = private_channels_response.json()
+    except ValueError:
+        print(f"チーム {team_id} のJSONデータ解析エラー: {private_channels_response.text}")
+        return {}
+    if not isinstance(private_channels, list):
+        print(f"channels_dataの形式が予期せぬものです: {private_channels}")
+        return {}
+
+    channel_mapping = {channel["display_name"]: channel["id"] for channel in public_channels}
+    channel_mapping.update({channel["display_name"]: channel["id"] for channel in private_channels})
+    return channel_mapping
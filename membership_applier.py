@@ -0,0 +1,111 @@
+import threading  # 複数スレッドからの同時利用に備えるためのライブラリ
+from collections import defaultdict  # チャンネルごとに招待をまとめるための辞書
+from concurrent.futures import ThreadPoolExecutor  # チャンネル単位で並行して招待するためのスレッドプール
+from typing import Dict, Iterable, List, Optional, Tuple
+from mattermost_api import MattermostClient  # 共有の Mattermost API クライアント
+from resolution_cache import ResolutionCache  # サーバーごとの対応状況を保存するキャッシュ
+
+# POST /channels/{id}/members が user_ids に対応していないサーバーが返すステータスコードです。
+# 400 は一部のユーザーが原因の場合もあるため、501 以外では対応状況を判定しません。
+UNSUPPORTED_STATUSES = (400, 501)
+
+
+class BulkMembershipApplier:
+    """チャンネルへの招待をチャンネルごとにまとめ、複数ユーザーを 1 回のリクエストで招待します。
+
+    招待は batch_size 件ずつ user_ids を指定して POST /channels/{id}/members に送ります。
+    サーバーが user_ids に対応していない場合は 1 件ずつのリクエストに切り替えます。
+    対応状況は一括招待が成功した場合か 501 が返った場合に判定します。400 の場合は 1 件ずつ送り直し、
+    成功したユーザー 1 人を user_ids で送り直して判定します（存在しないユーザーが原因の 400 で
+    対応していないと判定しないためです）。cache を渡すと判定結果をサーバーの URL ごとに保存して
+    次回以降の実行でも判定を省きます。
+    """
+
+    def __init__(
+        self,
+        client: MattermostClient,
+        cache: Optional[ResolutionCache] = None,
+        batch_size: int = 100,
+    ) -> None:
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._bulk_supported: Optional[bool] = cache.get("bulk_channel_members", client.url) if cache else None
+
+    @property
+    def bulk_supported(self) -> Optional[bool]:
+        """一括招待に対応しているかどうかです。まだ判定していない場合は None です。"""
+        return self._bulk_supported
+
+    def _set_bulk_supported(self, supported: bool) -> None:
+        with self._lock:
+            self._bulk_supported = supported
+        if self.cache:
+            self.cache.set("bulk_channel_members", self.client.url, supported)
+
+    def _add_one(self, channel_id: str, user_id: str) -> Tuple[bool, str]:
+        response = self.client.post(f"/channels/{channel_id}/members", json={"user_id": user_id})
+        return response.status_code == 201, f"API結果: {response.status_code} {response.text}"
+
+    def _probe_bulk(self, channel_id: str, user_id: str) -> None:
+        # 1 件ずつの招待に成功したユーザーだけを user_ids で送り直し、対応しているかどうかを判定します。
+        # 既に参加しているユーザーの招待は成功するため、400 が返れば user_ids に対応していないことがわかります。
+        response = self.client.post(f"/channels/{channel_id}/members", json={"user_ids": [user_id]})
+        if response.status_code == 201:
+            self._set_bulk_supported(True)
+        elif response.status_code in UNSUPPORTED_STATUSES:
+            self._set_bulk_supported(False)
+
+    def _add_batch(self, channel_id: str, user_ids: List[str]) -> Dict[str, Tuple[bool, str]]:
+        if len(user_ids) > 1 and self._bulk_supported is not False:
+            response = self.client.post(f"/channels/{channel_id}/members", json={"user_ids": user_ids})
+            if response.status_code == 201:
+                if self._bulk_supported is None:
+                    self._set_bulk_supported(True)
+                return {
+                    user_id: (True, f"API結果: {response.status_code} (一括招待 {len(user_ids)} 件)")
+                    for user_id in user_ids
+                }
+            if response.status_code not in UNSUPPORTED_STATUSES:
+                return {user_id: (False, f"API結果: {response.status_code} {response.text}") for user_id in user_ids}
+            if response.status_code == 501:
+                self._set_bulk_supported(False)
+
+            # 400 は対応していないサーバーの場合と、一部のユーザーが原因の場合があるため、1 件ずつ送り直します。
+            # まだ判定していない場合は、1 件ずつの招待に成功したユーザーで判定します。
+            results = {user_id: self._add_one(channel_id, user_id) for user_id in user_ids}
+            if self._bulk_supported is None:
+                succeeded = [user_id for user_id, (ok, _) in results.items() if ok]
+                if succeeded:
+                    self._probe_bulk(channel_id, succeeded[0])
+            return results
+        return {user_id: self._add_one(channel_id, user_id) for user_id in user_ids}
+
+    def add_members(self, channel_id: str, user_ids: Iterable[str]) -> Dict[str, Tuple[bool, str]]:
+        """ユーザーをチャンネルに招待し、ユーザーIDごとに (成功したかどうか, API 結果) を返します。"""
+        user_ids = list(dict.fromkeys(user_ids))
+        results: Dict[str, Tuple[bool, str]] = {}
+        for start in range(0, len(user_ids), self.batch_size):
+            results.update(self._add_batch(channel_id, user_ids[start : start + self.batch_size]))
+        return results
+
+    def apply(
+        self, adds: Iterable[Tuple[str, str]], concurrency: int = 4
+    ) -> Dict[Tuple[str, str], Tuple[bool, str]]:
+        """(チャンネルID, ユーザーID) の組をチャンネルごとにまとめて招待し、組ごとの結果を返します。
+
+        チャンネルは concurrency 件ずつ並行して処理します。
+        """
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for channel_id, user_id in adds:
+            groups[channel_id].append(user_id)
+
+        results: Dict[Tuple[str, str], Tuple[bool, str]] = {}
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            for channel_id, channel_results in zip(
+                groups, executor.map(lambda item: self.add_members(*item), groups.items())
+            ):
+                for user_id, result in channel_results.items():
+                    results[(channel_id, user_id)] = result
+        return results
@@ -0,0 +1,113 @@
+import csv  # CSVファイルを書き出すためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+from openpyxl import Workbook  # Excelファイルを作成・操作するためのライブラリ
+from openpyxl.styles import Font, NamedStyle, PatternFill  # Excelのセルの書式を共有するためのクラス
+from typing import Any, Dict, List, NamedTuple
+from matrix_export import WIDE_COLUMN_WIDTH, StyledCellFactory  # 参加状況の表と同じ列幅と、書式付きのセルを作るクラス
+from membership_index import MembershipIndex  # ユーザーとチャンネルを番号で保持する参加状況の索引
+
+# 変更の種類です。
+ADDED = "added"
+REMOVED = "removed"
+
+# Excel と CSV に表示する変更の種類の名前です。
+LABELS = {ADDED: "参加", REMOVED: "退出"}
+
+
+class Change(NamedTuple):
+    """2 つのスナップショットの間の参加状況の変更 1 件分です。"""
+
+    team: str
+    channel: str
+    username: str
+    action: str
+    channel_id: str
+    user_id: str
+
+
+def diff_indexes(old: MembershipIndex, new: MembershipIndex) -> List[Change]:
+    """old から new までに参加・退出した (ユーザー, チャンネル) の組を返します。
+
+    参加は new の、退出は old のチーム名・チャンネル名・ユーザー名で表します。
+    チームの順、チャンネル名、変更の種類、ユーザー名の順に並べます。
+    """
+    changes = []
+    for index, other, action in ((new, old, ADDED), (old, new, REMOVED)):
+        for channel_id, user_id in index.difference(other):
+            channel_number = index.channel_numbers[channel_id]
+            changes.append(
+                Change(
+                    index.channel_teams[channel_number],
+                    index.channel_names[channel_number],
+                    index.usernames[index.user_numbers[user_id]],
+                    action,
+                    channel_id,
+                    user_id,
+                )
+            )
+
+    team_order: Dict[str, int] = {}
+    for index in (new, old):
+        for team, _ in index.teams:
+            team_order.setdefault(team, len(team_order))
+    changes.sort(key=lambda change: (team_order[change.team], change.channel, change.action, change.username))
+    return changes
+
+
+def group_by_team(changes: List[Change]) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    """チーム名 -> {"added": [...], "removed": [...]} の辞書にまとめます。"""
+    teams: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+    for change in changes:
+        team = teams.setdefault(change.team, {ADDED: [], REMOVED: []})
+        team[change.action].append(
+            {
+                "channel": change.channel,
+                "username": change.username,
+                "channel_id": change.channel_id,
+                "user_id": change.user_id,
+            }
+        )
+    return teams
+
+
+def write_csv(path: str, changes: List[Change]) -> None:
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["チーム名", "チャンネル名", "ユーザー名", "変更", "チャンネルID", "ユーザーID"])
+        for change in changes:
+            writer.writerow(
+                [change.team, change.channel, change.username, LABELS[change.action], change.channel_id, change.user_id]
+            )
+
+
+def write_json(path: str, changes: List[Change], summary: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**summary, "teams": group_by_team(changes)}, f, ensure_ascii=False, indent=2)
+
+
+def write_excel(path: str, changes: List[Change]) -> None:
+    """変更の一覧を 1 つのシートに書き出します。参加は緑、退出は赤の背景色にします。"""
+    wb = Workbook(write_only=True)
+    styles = {
+        "header": NamedStyle(name="header", font=Font(bold=True)),
+        ADDED: NamedStyle(name=ADDED, fill=PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")),
+        REMOVED: NamedStyle(name=REMOVED, fill=PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")),
+    }
+    for style in styles.values():
+        wb.add_named_style(style)
+
+    ws = wb.create_sheet(title="参加状況の変更")
+    for column in "ABC":
+        ws.column_dimensions[column].width = WIDE_COLUMN_WIDTH
+    ws.freeze_panes = "A2"
+
+    cells = StyledCellFactory()
+    ws.append([cells.cell(ws, value, "header") for value in ("チーム名", "チャンネル名", "ユーザー名", "変更")])
+    for change in changes:
+        ws.append(
+            [
+                cells.cell(ws, value, change.action)
+                for value in (change.team, change.channel, change.username, LABELS[change.action])
+            ]
+        )
+    wb.save(path)
@@ -0,0 +1,137 @@
+from array import array  # ユーザー番号をコンパクトに保持するための配列
+from bisect import bisect_left  # 昇順の配列から番号を探すための関数
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# 参加を表す表の値です。
+MEMBER = "〇"
+
+
+class MembershipIndex:
+    """参加状況をユーザーとチャンネルの番号で保持するコンパクトな索引です。
+
+    ユーザーIDとチャンネルIDはそれぞれ一度だけ保持して 0 から始まる番号を振り、
+    各チャンネルのメンバーはユーザー番号の昇順の配列（array('i')）で保持します。
+    不参加の組み合わせは保持しないため、メモリは参加件数に比例します。
+
+    teams はチーム名と、そのチームに属するチャンネル番号の一覧です。
+    channel_teams はチャンネル番号ごとのチーム名です。
+    メンバーが一人もいないチャンネルと、チャンネルのないチームは含めません。
+    """
+
+    def __init__(self) -> None:
+        self.user_ids: List[str] = []
+        self.usernames: List[str] = []
+        self.user_numbers: Dict[str, int] = {}
+        self.channel_ids: List[str] = []
+        self.channel_names: List[str] = []
+        self.channel_teams: List[str] = []
+        self.channel_numbers: Dict[str, int] = {}
+        self.members: List[array] = []
+        self.teams: List[Tuple[str, List[int]]] = []
+        self._user_channels: Optional[List[array]] = None
+
+    @classmethod
+    def build(
+        cls,
+        users: Dict[str, str],
+        teams: List[Dict[str, Any]],
+        channels: Dict[str, List[Dict[str, Any]]],
+        members: Dict[str, Iterable[str]],
+    ) -> "MembershipIndex":
+        """MembershipSnapshot と同じ形のユーザー、チーム、チャンネル、メンバー一覧から索引を作ります。
+
+        users にないユーザーのメンバー情報は無視します。
+        """
+        index = cls()
+        for user_id, username in users.items():
+            index.user_numbers[user_id] = len(index.user_ids)
+            index.user_ids.append(user_id)
+            index.usernames.append(username)
+
+        for team in teams:
+            # 同じチーム内で同じ名前のチャンネルは、表の列と同様に後のもので置き換えます。
+            team_channels: Dict[str, int] = {}
+            for channel in channels.get(team["id"], []):
+                numbers = sorted(
+                    index.user_numbers[user_id]
+                    for user_id in members.get(channel["id"], ())
+                    if user_id in index.user_numbers
+                )
+                if not numbers:
+                    continue
+                index.channel_numbers[channel["id"]] = len(index.channel_ids)
+                team_channels[channel["display_name"]] = len(index.channel_ids)
+                index.channel_ids.append(channel["id"])
+                index.channel_names.append(channel["display_name"])
+                index.channel_teams.append(team["display_name"])
+                index.members.append(array("i", numbers))
+            if team_channels:
+                index.teams.append((team["display_name"], list(team_channels.values())))
+        return index
+
+    def is_member(self, channel_id: str, user_id: str) -> bool:
+        if channel_id not in self.channel_numbers or user_id not in self.user_numbers:
+            return False
+        numbers = self.members[self.channel_numbers[channel_id]]
+        user_number = self.user_numbers[user_id]
+        position = bisect_left(numbers, user_number)
+        return position < len(numbers) and numbers[position] == user_number
+
+    def channel_members(self, channel_id: str) -> List[str]:
+        """チャンネルのメンバーのユーザーIDを返します。"""
+        if channel_id not in self.channel_numbers:
+            return []
+        return [self.user_ids[number] for number in self.members[self.channel_numbers[channel_id]]]
+
+    def user_channels(self, user_id: str) -> List[str]:
+        """ユーザーが参加しているチャンネルのIDを返します。
+
+        初回の呼び出しでユーザーごとのチャンネル番号の一覧を作り、以降はそれを使います。
+        """
+        if user_id not in self.user_numbers:
+            return []
+        if self._user_channels is None:
+            self._user_channels = [array("i") for _ in self.user_ids]
+            for channel_number, numbers in enumerate(self.members):
+                for user_number in numbers:
+                    self._user_channels[user_number].append(channel_number)
+        return [self.channel_ids[number] for number in self._user_channels[self.user_numbers[user_id]]]
+
+    def member_ids(self, channel_number: int) -> Set[str]:
+        """チャンネル番号のメンバーのユーザーIDの集合を返します。"""
+        return {self.user_ids[number] for number in self.members[channel_number]}
+
+    def difference(self, other: "MembershipIndex") -> Iterator[Tuple[str, str]]:
+        """この索引にあり other にない (チャンネルID, ユーザーID) の組を返します。
+
+        2 つの索引では番号の振り方が異なるため、ID で突き合わせます。
+        所要時間は両方の参加件数の合計に比例します。
+        """
+        for channel_number, channel_id in enumerate(self.channel_ids):
+            if channel_id in other.channel_numbers:
+                others = other.member_ids(other.channel_numbers[channel_id])
+            else:
+                others = set()
+            for user_number in self.members[channel_number]:
+                user_id = self.user_ids[user_number]
+                if user_id not in others:
+                    yield channel_id, user_id
+
+    def team_rows(self, team_position: int) -> Iterator[Tuple[str, List[str]]]:
+        """1 チーム分の (ユーザー名, チャンネルごとの参加状況) をユーザーの順に返します。
+
+        チーム内のどのチャンネルにも参加していないユーザーは含めません。
+        各ユーザーの参加チャンネルは、チーム内の列番号のビット列として組み立てます。
+        """
+        _, channel_numbers = self.teams[team_position]
+        columns: Dict[int, int] = {}
+        for column, channel_number in enumerate(channel_numbers):
+            bit = 1 << column
+            for user_number in self.members[channel_number]:
+                columns[user_number] = columns.get(user_number, 0) | bit
+
+        for user_number in sorted(columns):
+            bits = columns[user_number]
+            yield self.usernames[user_number], [
+                MEMBER if bits >> column & 1 else "" for column in range(len(channel_numbers))
+            ]
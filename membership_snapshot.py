@@ -0,0 +1,135 @@
+import requests  # HTTPリクエストを送るためのライブラリ
+from concurrent.futures import ThreadPoolExecutor, as_completed  # チームごとに並行して取得するためのスレッドプール
+from datetime import datetime, timedelta  # 日時と時間差を扱うためのライブラリ
+from typing import Any, Dict, List, Optional, Set, Tuple
+from mattermost_api import PER_PAGE, MattermostClient  # 共有の Mattermost API クライアント
+from membership_index import MembershipIndex  # ユーザーとチャンネルを番号で保持する参加状況の索引
+
+
+class MembershipSnapshot:
+    """チーム・チャンネル単位でユーザーの参加状況を一括取得します。
+
+    ユーザーごとに所属チャンネルを辿るのではなく、チームとチャンネルを一度だけ列挙し、
+    各チャンネルのメンバー一覧をページ単位で一度だけ取得して参加状況の表を組み立てます。
+    リクエスト数は O(チーム数 + チャンネル数 + メンバーのページ数) になります。
+
+    前回のスナップショットを build に渡すと、update_at と last_post_at が変わっておらず、メンバーが
+    PER_PAGE 人を超えるチャンネルは、GET /channels/{id}/stats の member_count も変わっていなければ
+    メンバー一覧を取得せず、前回の結果を使います。チームからの退出などでは update_at と last_post_at が
+    変わらないため、member_count も確認します。メンバーが PER_PAGE 人以下のチャンネルは、
+    メンバー一覧も 1 回のリクエストで取得できるため、確認せずに取得し直します。
+    """
+
+    def __init__(self, client: Optional[MattermostClient] = None) -> None:
+        self.client = client
+        self.users: Dict[str, str] = {}
+        self.teams: List[Dict[str, Any]] = []
+        self.channels: Dict[str, List[Dict[str, Any]]] = {}
+        self.members: Dict[str, Set[str]] = {}
+        self.refreshed_channels: Set[str] = set()
+        self.full = False
+        self.request_count = 0
+        self.elapsed = timedelta(0)
+
+    def _get_team_channels(self, team_id: str) -> List[Dict[str, Any]]:
+        channels = list(self.client.iter_pages(f"/teams/{team_id}/channels"))
+        try:
+            channels += list(self.client.iter_pages(f"/teams/{team_id}/channels/private"))
+        except requests.HTTPError:
+            # システム管理者権限がない場合は、自分が参加しているプライベートチャンネルのみ取得します。
+            response = self.client.get(f"/users/me/teams/{team_id}/channels")
+            response.raise_for_status()
+            channels += [channel for channel in response.json() if channel["type"] == "P"]
+
+        # 重複とチャンネル名が空のものを除外します。
+        channels = [channel for channel in channels if channel["display_name"].strip()]
+        return list({channel["id"]: channel for channel in channels}.values())
+
+    def _member_count(self, channel_id: str) -> Optional[int]:
+        # 取得できない場合は None を返し、メンバー一覧を取得し直します。
+        response = self.client.get(f"/channels/{channel_id}/stats")
+        if response.status_code != 200:
+            return None
+        return response.json().get("member_count")
+
+    def channel_marks(self) -> Dict[str, Tuple[int, int, Optional[int]]]:
+        """チャンネルID -> (update_at, last_post_at, member_count) の辞書を返します。"""
+        return {
+            channel["id"]: (channel.get("update_at", 0), channel.get("last_post_at", 0), channel.get("member_count"))
+            for channels in self.channels.values()
+            for channel in channels
+        }
+
+    def _crawl_team(
+        self,
+        team: Dict[str, Any],
+        previous: Optional["MembershipSnapshot"],
+        previous_marks: Dict[str, Tuple[int, int, Optional[int]]],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Set[str]], Set[str]]:
+        """1 チーム分のチャンネル一覧と、各チャンネルのメンバー一覧を取得します。"""
+        channels = self._get_team_channels(team["id"])
+        members: Dict[str, Set[str]] = {}
+        refreshed: Set[str] = set()
+        for channel in channels:
+            # 前回から変更のない、メンバー一覧が複数ページにわたるチャンネルは、前回のメンバー一覧を使います。
+            channel["member_count"] = None
+            stored = previous.members.get(channel["id"]) if previous else None
+            mark = previous_marks.get(channel["id"])
+            if (
+                stored is not None
+                and len(stored) > PER_PAGE
+                and mark is not None
+                and mark[:2] == (channel.get("update_at", 0), channel.get("last_post_at", 0))
+            ):
+                channel["member_count"] = self._member_count(channel["id"])
+                if channel["member_count"] is not None and channel["member_count"] == mark[2]:
+                    members[channel["id"]] = stored
+                    continue
+            members[channel["id"]] = {
+                member["user_id"]
+                for member in self.client.iter_pages(f"/channels/{channel['id']}/members")
+            }
+            refreshed.add(channel["id"])
+            # 次回に比較する member_count は、stats を取得していなければメンバー一覧の人数で代用します。
+            # （stats は無効化されたユーザーを数えないため、一致しなければ次回に一度だけ取得し直します。）
+            if channel["member_count"] is None:
+                channel["member_count"] = len(members[channel["id"]])
+        return channels, members, refreshed
+
+    def build(
+        self, previous: Optional["MembershipSnapshot"] = None, workers: int = 1
+    ) -> "MembershipSnapshot":
+        """サーバーから参加状況を取得します。workers 個のチームを並行して取得します。"""
+        start_time = datetime.now()
+        start_count = self.client.request_count
+        previous_marks = previous.channel_marks() if previous else {}
+        self.full = previous is None
+
+        self.users = {user["id"]: user["username"] for user in self.client.iter_pages("/users")}
+        self.teams = list(self.client.iter_pages("/teams"))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._crawl_team, team, previous, previous_marks): team for team in self.teams}
+            for future in as_completed(futures):
+                team = futures[future]
+                channels, members, refreshed = future.result()
+                self.channels[team["id"]] = channels
+                self.members.update(members)
+                self.refreshed_channels |= refreshed
+
+                # チームごとに実行状況を表示します。
+                elapsed_time = datetime.now() - start_time
+                print(
+                    f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (経過時間: {str(elapsed_time).split('.')[0]}) {team['display_name']} チームのチャンネルの一覧を取得しました (リクエスト数: {self.client.request_count - start_count})"
+                )
+
+        self.request_count = self.client.request_count - start_count
+        self.elapsed = datetime.now() - start_time
+        return self
+
+    def index(self) -> MembershipIndex:
+        """参加状況をユーザーとチャンネルの番号で保持する索引を返します。
+
+        メンバーが一人もいないチャンネルと、参加チャンネルのないチームは含めません。
+        """
+        return MembershipIndex.build(self.users, self.teams, self.channels, self.members)
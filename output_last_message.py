@@ -1,38 +1,87 @@
 import os
+import argparse
 import json
-import requests
 import sys
 import datetime
-import pandas as pd
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
+from activity_stats import ActivityStats
+from app_config import load_config
+from bulk_export import BulkExportSource
+from instrumentation import start_run
+from mattermost_api import MattermostClient
+import mattermost_async
 
 # 設定ファイルを読み込みます。
 try:
-    with open("config.json") as f:
-        config = json.load(f)
+    config = load_config()
 except (FileNotFoundError, json.JSONDecodeError) as e:
     print(f"設定ファイルの読み込みに失敗しました: {e}")
     sys.exit(1)
 
+parser = argparse.ArgumentParser(description="チャンネルごとの最終メッセージ日時をExcelに書き出します")
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=None,
+    help="同時に送るリクエスト数（既定値は config.json の concurrency または 8、--async では async_concurrency）",
+)
+parser.add_argument(
+    "--exact-posts",
+    action="store_true",
+    help="チャンネル情報の last_post_at を使わず、各チャンネルの最新の投稿を取得します",
+)
+parser.add_argument(
+    "--async",
+    dest="use_async",
+    action="store_true",
+    help="aiohttp による非同期の通信で取得します（--concurrency を指定すると同時に送るリクエスト数になります）",
+)
+parser.add_argument(
+    "--bulk-export",
+    default=config.get("bulk_export_file"),
+    help="サーバーに接続せず、mmctl export で作成したバルクエクスポート（.jsonl または .zip）の投稿から求めます",
+)
+parser.add_argument(
+    "--stats",
+    action="store_true",
+    help="前回の続きから投稿を取得し、チャンネルごとの週ごとの投稿数と投稿者数を Activity シートに書き出します",
+)
+args = parser.parse_args()
+
+# pandas は読み込みに時間がかかるため、--help や引数の誤りでは読み込まず、引数の解析後に読み込みます。
+import pandas as pd
+# --async の同時リクエスト数は、--concurrency を明示した場合のみ上書きします。
+async_concurrency = args.concurrency
+if args.concurrency is None:
+    args.concurrency = config.get("concurrency", 8)
+
+if args.stats and args.bulk_export:
+    print("--stats は --bulk-export と同時には指定できません")
+    sys.exit(1)
+
+# config.json の metrics_file / profile_file を指定すると、終了時に計測結果を出力します。
+start_run(config)
+
 # Mattermost のエンドポイントとアクセストークンを設定します。
 url = config["url"]
 token = config["token"]
-headers = {"Authorization": f"Bearer {token}"}
+# バルクエクスポートから求める場合は、サーバーに接続しません。
+client = None if args.bulk_export else MattermostClient.from_config(
+    {**config, "pool_size": max(config.get("pool_size", 10), args.concurrency)}
+)
 
 # 出力ファイルを作成します。
 output_file_path = os.path.join(config["excel_dir"], "output_last_message.xlsx")
 
 def get_all_teams():
-    response = requests.get(f"{url}/api/v4/teams", headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return client.iter_pages("/teams")
 
 def get_channels_for_team(team_id):
-    public_channels_response = requests.get(f"{url}/api/v4/teams/{team_id}/channels", headers=headers)
-    public_channels_response.raise_for_status()
-    private_channels_response = requests.get(f"{url}/api/v4/users/me/teams/{team_id}/channels", headers=headers)
+    private_channels_response = client.get(f"/users/me/teams/{team_id}/channels")
     private_channels_response.raise_for_status()
-    channels = public_channels_response.json() + private_channels_response.json()
+    channels = list(client.iter_pages(f"/teams/{team_id}/channels")) + private_channels_response.json()
 
     # Remove possible duplicates and empty channel names
     channels = [channel for channel in channels if channel["display_name"].strip() != ""]
@@ -41,9 +90,8 @@ def get_channels_for_team(team_id):
     return channels
 
 def get_last_message_info(channel_id):
-    response = requests.get(
-        f"{url}/api/v4/channels/{channel_id}/posts",
-        headers=headers,
+    response = client.get(
+        f"/channels/{channel_id}/posts",
         params={"page": 0, "per_page": 1},
     )
 
@@ -64,13 +112,105 @@ def get_last_message_info(channel_id):
 
     return last_post_time
 
-data = []
+def get_last_message_time(channel):
+    # チャンネル情報に last_post_at があれば、投稿を取得せずにそれを使います。
+    if not args.exact_posts and "last_post_at" in channel:
+        if not channel["last_post_at"]:
+            return None
+        return datetime.datetime.fromtimestamp(channel["last_post_at"] / 1000.0)
+    return get_last_message_info(channel["id"])
 
-for team in get_all_teams():
-    for channel in get_channels_for_team(team["id"]):
-        last_message_time = get_last_message_info(channel["id"])
+async def get_last_message_time_async(async_client, channel):
+    if not args.exact_posts and "last_post_at" in channel:
+        return get_last_message_time(channel)
+    return await mattermost_async.get_last_message_info(async_client, channel["id"])
+
+async def collect_async():
+    # --async では、チャンネル一覧と最終メッセージ日時を 1 つのイベントループで並行して取得します。
+    async with mattermost_async.AsyncMattermostClient.from_config(config, async_concurrency) as async_client:
+        teams = await mattermost_async.get_all_teams(async_client)
+        team_channels = await asyncio.gather(
+            *(mattermost_async.get_channels_for_team(async_client, team["id"]) for team in teams)
+        )
+        last_message_times = await asyncio.gather(
+            *(
+                get_last_message_time_async(async_client, channel)
+                for channels in team_channels
+                for channel in channels
+            )
+        )
+    return teams, team_channels, iter(last_message_times)
+
+def collect():
+    # チームごとのチャンネル一覧と、各チャンネルの最終メッセージ日時を並行して取得します。
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        teams = list(get_all_teams())
+        team_channels = list(executor.map(lambda team: get_channels_for_team(team["id"]), teams))
+        last_message_times = list(
+            executor.map(
+                get_last_message_time, [channel for channels in team_channels for channel in channels]
+            )
+        )
+    return teams, team_channels, iter(last_message_times)
+
+def collect_bulk_export():
+    # バルクエクスポートの投稿から求めたチャンネルごとの last_post_at を使います。
+    teams, team_channels = BulkExportSource(args.bulk_export).team_channels()
+    last_message_times = [
+        datetime.datetime.fromtimestamp(channel["last_post_at"] / 1000.0) if channel["last_post_at"] else None
+        for channels in team_channels
+        for channel in channels
+    ]
+    return teams, team_channels, iter(last_message_times)
+
+if args.bulk_export:
+    teams, team_channels, last_message_times = collect_bulk_export()
+elif args.use_async:
+    teams, team_channels, last_message_times = asyncio.run(collect_async())
+else:
+    teams, team_channels, last_message_times = collect()
+
+data = []
+for team, channels in zip(teams, team_channels):
+    for channel, last_message_time in zip(channels, last_message_times):
         channel_type = "Public" if channel["type"] == "O" else "Private"
         if last_message_time is not None:
             data.append({
                 'Team': team['display_name'],
-               
+                'Channel': channel['display_name'],
+                'Type': channel_type,
+                'Last Message': last_message_time,
+            })
+
+def collect_stats():
+    # config.json の activity_state_file に、チャンネルごとの取得済みの投稿日時とカウンターを保存します。
+    stats = ActivityStats(
+        config.get("activity_state_file", os.path.join(config["excel_dir"], "activity_stats.json")),
+        backfill_days=config.get("activity_backfill_days"),
+    )
+    channels = [channel for channels in team_channels for channel in channels]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        new_posts = sum(executor.map(lambda channel: stats.update_channel(client, channel), channels))
+    stats.save()
+    print(f"投稿の集計を更新しました (新しい投稿: {new_posts} 件)")
+
+    weeks = config.get("activity_weeks", 8)
+    today = datetime.date.today()
+    return [
+        {
+            'Team': team['display_name'],
+            'Channel': channel['display_name'],
+            'Type': "Public" if channel["type"] == "O" else "Private",
+            **stats.summary_row(channel["id"], weeks, today),
+        }
+        for team, channels in zip(teams, team_channels)
+        for channel in channels
+    ]
+
+# チャンネルごとの最終メッセージ日時をExcelに書き出します。
+df = pd.DataFrame(data, columns=['Team', 'Channel', 'Type', 'Last Message'])
+with pd.ExcelWriter(output_file_path) as writer:
+    df.to_excel(writer, index=False)
+    if args.stats:
+        pd.DataFrame(collect_stats()).to_excel(writer, sheet_name="Activity", index=False)
+print(f"最終メッセージの一覧を出力しました: {output_file_path}")
@@ -1,140 +1,437 @@
-import json
-import pandas as pd
-import requests
-from typing import Dict, Optional
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from app_config import load_config
+from checkpoint import CheckpointJournal, file_fingerprint
+from instrumentation import start_run
+from mattermost_api import MattermostClient
+from membership_applier import BulkMembershipApplier
+import mattermost_async
+from resolution_cache import ResolutionCache, UserResolver
+
+# pandas は読み込みに時間がかかるため、--help や引数の誤りでは読み込まず、引数の解析後に読み込む
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 
 # config.json を読み込む関数
 def read_config() -> Dict[str, str]:
     try:
-        with open("config.json") as f:
-            config = json.load(f)
+        config = load_config()
     except FileNotFoundError:
         raise FileNotFoundError("config.json が存在しません")
     return config
 
 
 # メールアドレスでユーザーを検索する関数
-def get_user_by_email(url: str, token: str, email: str) -> Optional[str]:
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{url}/api/v4/users/email/{email}", headers=headers)
+def get_user_by_email(client: MattermostClient, email: str) -> Optional[str]:
+    response = client.get(f"/users/email/{email}")
     if response.status_code == 200:
         return response.json()["id"]
     elif response.status_code == 404:
-        print(f"No user with email {email} found")
+        logger.info(f"No user with email {email} found")
         return None
     else:
-        print(f"Error searching for user with email {email}: {response.text}")
+        logger.error(f"Error searching for user with email {email}: {response.text}")
         return None
 
 
 # ユーザーを作成する関数
-def create_user(url: str, token: str, user_data: Dict[str, str]) -> Optional[str]:
-    # ユーザーが既に存在するかどうか確認
-    existing_user_id = get_user_by_email(url, token, user_data["email"])
+def create_user(
+    client: MattermostClient,
+    user_data: Dict[str, str],
+    resolver: Optional[UserResolver] = None,
+) -> Optional[str]:
+    # ユーザーが既に存在するかどうか確認（resolver があれば一括取得済みの結果を使う）
+    if resolver:
+        existing_user_id = resolver.id_for_email(user_data["email"])
+    else:
+        existing_user_id = get_user_by_email(client, user_data["email"])
     if existing_user_id:
-        print(f"User {user_data['email']} already exists")
+        logger.info(f"User {user_data['email']} already exists")
         return existing_user_id
 
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.post(f"{url}/api/v4/users", headers=headers, json=user_data)
+    response = client.post("/users", json=user_data)
     if response.status_code == 201:
-        print(f"User {user_data['email']} created successfully")
+        logger.info(f"User {user_data['email']} created successfully")
+        if resolver:
+            resolver.add(response.json())
         return response.json()["id"]
     else:
-        print(f"Error creating user {user_data['email']}: {response.text}")
+        logger.error(f"Error creating user {user_data['email']}: {response.text}")
         return None
 
 
 # チームIDを取得する関数
-def get_team_id(url: str, token: str, team_name: str) -> Optional[str]:
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{url}/api/v4/teams/name/{team_name}", headers=headers)
+def get_team_id(client: MattermostClient, team_name: str) -> Optional[str]:
+    response = client.get(f"/teams/name/{team_name}")
     if response.status_code == 200:
         return response.json()["id"]
     elif response.status_code == 404:
-        print(f"Team {team_name} does not exist")
+        logger.warning(f"Team {team_name} does not exist")
         return None
     else:
-        print(f"Error getting team ID for {team_name}: {response.text}")
+        logger.error(f"Error getting team ID for {team_name}: {response.text}")
         return None
 
 
 # チャンネルIDを取得する関数
 def get_channel_id(
-    url: str, token: str, team_id: str, channel_name: str
+    client: MattermostClient, team_id: str, channel_name: str
 ) -> Optional[str]:
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(
-        f"{url}/api/v4/teams/{team_id}/channels/name/{channel_name}", headers=headers
-    )
+    response = client.get(f"/teams/{team_id}/channels/name/{channel_name}")
     if response.status_code == 200:
         return response.json()["id"]
     elif response.status_code == 404:
-        print(f"Channel {channel_name} does not exist")
+        logger.warning(f"Channel {channel_name} does not exist")
         return None
     else:
-        print(f"Error getting channel ID for {channel_name}: {response.text}")
+        logger.error(f"Error getting channel ID for {channel_name}: {response.text}")
         return None
 
 
 # ユーザーをチャンネルに追加する関数
-def add_user_to_channel(url: str, token: str, user_id: str, channel_id: str) -> None:
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.post(
-        f"{url}/api/v4/channels/{channel_id}/members",
-        headers=headers,
+def add_user_to_channel(client: MattermostClient, user_id: str, channel_id: str) -> bool:
+    response = client.post(
+        f"/channels/{channel_id}/members",
         json={"user_id": user_id},
     )
     if response.status_code == 201:
-        print(f"User {user_id} added to channel {channel_id}")
-    else:
-        print(f"Error adding user {user_id} to channel {channel_id}: {response.text}")
+        logger.info(f"User {user_id} added to channel {channel_id}")
+        return True
+    logger.error(f"Error adding user {user_id} to channel {channel_id}: {response.text}")
+    return False
 
 
 # ユーザーをチームに追加する関数
-def add_user_to_team(url: str, token: str, user_id: str, team_id: str) -> None:
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.post(
-        f"{url}/api/v4/teams/{team_id}/members",
-        headers=headers,
+def add_user_to_team(client: MattermostClient, user_id: str, team_id: str) -> bool:
+    response = client.post(
+        f"/teams/{team_id}/members",
         json={"user_id": user_id, "team_id": team_id},
     )
     if response.status_code == 201:
-        print(f"User {user_id} added to team {team_id}")
+        logger.info(f"User {user_id} added to team {team_id}")
+        return True
+    logger.error(f"Error adding user {user_id} to team {team_id}: {response.text}")
+    return False
+
+
+# CSVの1行分のユーザーを作成し、チーム、チャンネルの順に追加する関数
+# defer_channel=True の場合はチャンネルへの追加を行わず、channel="pending" と channel_id を結果に残す
+# （add_pending_channels でチャンネルごとにまとめて追加する）
+def register_row(
+    client: MattermostClient,
+    cache: ResolutionCache,
+    resolver: UserResolver,
+    index: int,
+    row: Dict[str, Any],
+    defer_channel: bool = False,
+) -> Dict[str, Any]:
+    user_data = {
+        "email": row["email"],
+        "username": row["username"],
+        "password": row["password"],
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+    }
+    result = {"row": index, "email": row["email"], "user_id": None, "team": "skipped", "channel": "skipped"}
+
+    # ユーザー作成に失敗した場合は、チームとチャンネルへの追加を行わない
+    result["user_id"] = create_user(client, user_data, resolver)
+    if not result["user_id"]:
+        return result
+
+    # チームIDとチャンネルIDは行をまたいでキャッシュし、同じ名前は一度だけ問い合わせる
+    # （resolve_targets で解決済みの行は team_id / channel_id の列を使う）
+    if "team_id" in row:
+        team_id = row["team_id"]
+    else:
+        team_id = cache.get_or_resolve(
+            "team", row["team_name"], lambda: get_team_id(client, row["team_name"])
+        )
+    if not team_id:
+        result["team"] = "not found"
+        return result
+    result["team"] = "added" if add_user_to_team(client, result["user_id"], team_id) else "failed"
+    if result["team"] == "failed":
+        return result
+
+    if "channel_id" in row:
+        channel_id = row["channel_id"]
+    else:
+        channel_id = cache.get_or_resolve(
+            "channel",
+            f"{team_id}/{row['channel_name']}",
+            lambda: get_channel_id(client, team_id, row["channel_name"]),
+        )
+    if not channel_id:
+        result["channel"] = "not found"
+        return result
+    if defer_channel:
+        result["channel"] = "pending"
+        result["channel_id"] = channel_id
+        return result
+    result["channel"] = "added" if add_user_to_channel(client, result["user_id"], channel_id) else "failed"
+    return result
+
+
+# ジャーナルで行を識別するキー（行番号とメールアドレス）
+def journal_key(index: int, row: Dict[str, Any]) -> str:
+    return f"{index}:{row['email']}"
+
+
+# 複数の行を並行して処理する関数（1行の中の処理順は維持され、チャンネルへの追加は後でまとめて行う）
+def register_rows(
+    client: MattermostClient,
+    cache: ResolutionCache,
+    resolver: UserResolver,
+    rows: List[Tuple[int, Dict[str, Any]]],
+    concurrency: int,
+) -> List[Dict[str, Any]]:
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return list(
+            executor.map(
+                lambda item: register_row(client, cache, resolver, *item, defer_channel=True),
+                rows,
+            )
+        )
+
+
+# register_row(defer_channel=True) の非同期版（--async）。1行の中の処理順は同期版と同じ
+async def register_row_async(
+    client: mattermost_async.AsyncMattermostClient,
+    cache: ResolutionCache,
+    resolver: UserResolver,
+    index: int,
+    row: Dict[str, Any],
+) -> Dict[str, Any]:
+    user_data = {
+        "email": row["email"],
+        "username": row["username"],
+        "password": row["password"],
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+    }
+    result = {"row": index, "email": row["email"], "user_id": None, "team": "skipped", "channel": "skipped"}
+    result["user_id"] = await mattermost_async.create_user(client, user_data, resolver)
+    if not result["user_id"]:
+        return result
+
+    if "team_id" in row:
+        team_id = row["team_id"]
+    else:
+        team_id = await cache.get_or_resolve_async(
+            "team", row["team_name"], lambda: mattermost_async.get_team_id(client, row["team_name"])
+        )
+    if not team_id:
+        result["team"] = "not found"
+        return result
+    if not await mattermost_async.add_user_to_team(client, result["user_id"], team_id):
+        result["team"] = "failed"
+        return result
+    result["team"] = "added"
+
+    if "channel_id" in row:
+        channel_id = row["channel_id"]
     else:
-        print(f"Error adding user {user_id} to team {team_id}: {response.text}")
+        channel_id = await cache.get_or_resolve_async(
+            "channel",
+            f"{team_id}/{row['channel_name']}",
+            lambda: mattermost_async.get_channel_id(client, team_id, row["channel_name"]),
+        )
+    if not channel_id:
+        result["channel"] = "not found"
+        return result
+    result["channel"] = "pending"
+    result["channel_id"] = channel_id
+    return result
+
+
+# すべての行を1つのイベントループで並行して処理する関数（--async）
+async def register_rows_async(
+    config: Dict[str, Any],
+    cache: ResolutionCache,
+    resolver: UserResolver,
+    rows: List[Tuple[int, Dict[str, Any]]],
+    concurrency: Optional[int],
+) -> List[Dict[str, Any]]:
+    # concurrency が None の場合は config.json の async_concurrency を使う
+    async with mattermost_async.AsyncMattermostClient.from_config(config, concurrency) as client:
+        return await asyncio.gather(
+            *(register_row_async(client, cache, resolver, index, row) for index, row in rows)
+        )
+
+
+# channel="pending" の行をチャンネルごとにまとめ、複数ユーザーずつチャンネルに追加する関数
+def add_pending_channels(
+    applier: BulkMembershipApplier, results: List[Dict[str, Any]], concurrency: int
+) -> None:
+    pending = [result for result in results if result["channel"] == "pending"]
+    outcomes = applier.apply(
+        ((result["channel_id"], result["user_id"]) for result in pending), concurrency
+    )
+    for result in pending:
+        added, detail = outcomes[(result["channel_id"], result["user_id"])]
+        result["channel"] = "added" if added else "failed"
+        if added:
+            logger.info(f"User {result['user_id']} added to channel {result['channel_id']}")
+        else:
+            logger.error(f"Error adding user {result['user_id']} to channel {result['channel_id']}: {detail}")
+
+
+# 登録先の (チーム名, チャンネル名) の組ごとにチームIDとチャンネルIDを一度だけ問い合わせ、
+# team_id / channel_id の列として行に付ける関数（見つからなかった場合は None）
+def resolve_targets(
+    client: MattermostClient, cache: ResolutionCache, rows: "pd.DataFrame", concurrency: int
+) -> "pd.DataFrame":
+    import pandas as pd
+    from registration_input import distinct_targets
+
+    def resolve(target: Tuple[str, str]) -> Tuple[str, str, Optional[str], Optional[str]]:
+        team_name, channel_name = target
+        team_id = cache.get_or_resolve("team", team_name, lambda: get_team_id(client, team_name))
+        channel_id = None
+        if team_id:
+            channel_id = cache.get_or_resolve(
+                "channel",
+                f"{team_id}/{channel_name}",
+                lambda: get_channel_id(client, team_id, channel_name),
+            )
+        return team_name, channel_name, team_id, channel_id
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        ids = pd.DataFrame(
+            list(executor.map(resolve, distinct_targets(rows))),
+            columns=["team_name", "channel_name", "team_id", "channel_id"],
+            dtype=object,
+        )
+    rows = rows.join(ids.set_index(["team_name", "channel_name"]), on=["team_name", "channel_name"])
+    rows[["team_id", "channel_id"]] = rows[["team_id", "channel_id"]].astype(object).where(
+        rows[["team_id", "channel_id"]].notna(), None
+    )
+    return rows
+
+
+# 行ごとの処理結果のサマリーを表示する関数
+def print_summary(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        print(
+            f"Row {result['row']}: {result['email']} "
+            f"user={result['user_id'] or 'failed'} team={result['team']} channel={result['channel']}"
+        )
+    completed = sum(1 for result in results if result["channel"] == "added")
+    print(f"{completed}/{len(results)} rows completed")
 
 
 def main():
     # config.json の読み込み
     config = read_config()
 
-    # CSVファイルを読み込む
-    df = pd.read_csv(config["csv_file"])
-
-    # 各ユーザーを作成し、チームとチャンネルに追加
-    for _, row in df.iterrows():
-        user_data = {
-            "email": row["email"],
-            "username": row["username"],
-            "password": row["password"],
-            "first_name": row["first_name"],
-            "last_name": row["last_name"],
-        }
-
-        # ユーザー作成
-        user_id = create_user(config["url"], config["token"], user_data)
-        team_id = get_team_id(config["url"], config["token"], row["team_name"])
-        if team_id:
-            add_user_to_team(
-                config["url"], config["token"], user_id, team_id
-            )  # ユーザーをチームに追加
-            channel_id = get_channel_id(
-                config["url"], config["token"], team_id, row["channel_name"]
-            )
-            if channel_id:
-                add_user_to_channel(config["url"], config["token"], user_id, channel_id)
+    parser = argparse.ArgumentParser(description="CSVファイルからMattermostユーザーを登録します")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="同時に処理する行数（2以上で並行モード、既定値は config.json の concurrency または 1）",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="aiohttp による非同期の通信で処理する（--concurrency を指定すると同時に送るリクエスト数になる。"
+        "指定しない場合は config.json の async_concurrency）",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="前回のジャーナルを読み込み、完了済みの行を飛ばして失敗した行と未処理の行のみ処理する",
+    )
+    parser.add_argument(
+        "--journal",
+        default=config.get("register_journal", "register_users.journal.jsonl"),
+        help="完了した行を記録するジャーナルファイル",
+    )
+    args = parser.parse_args()
+    # --async の同時リクエスト数は、--concurrency を明示した場合のみ上書きする
+    async_concurrency = args.concurrency
+    if args.concurrency is None:
+        args.concurrency = config.get("concurrency", 1)
+
+    import pandas as pd
+    from registration_input import RegistrationValidator, read_chunks, write_rejected
+
+    # metrics_file / profile_file を指定すると、終了時に計測結果を出力する
+    start_run(config)
+
+    client = MattermostClient.from_config(
+        {**config, "pool_size": max(config.get("pool_size", 10), args.concurrency)}
+    )
+
+    cache = ResolutionCache.from_config(config)
+
+    # 並行モードでは各行の進捗を表示せず、エラーと最後のサマリーのみ表示する
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO if args.concurrency <= 1 and not args.use_async else logging.WARNING,
+    )
+
+    # 完了した行をジャーナルに記録する（--resume では完了済みの行を飛ばす）
+    journal = CheckpointJournal(args.journal, file_fingerprint(config["csv_file"]), resume=args.resume)
+
+    resolver = UserResolver(client)
+    applier = BulkMembershipApplier(client, cache)
+    validator = RegistrationValidator()
+    rejected_file = config.get("rejected_file", "rejected_users.csv")
+
+    # CSVファイルを csv_chunksize 行ずつ読み込み、検証と重複の除去をまとめて行ってから登録する
+    try:
+        for chunk_number, chunk in enumerate(
+            read_chunks(config["csv_file"], config.get("csv_chunksize", 50000))
+        ):
+            valid, rejected = validator.validate(chunk)
+            write_rejected(rejected_file, rejected, first=chunk_number == 0)
+
+            # 完了済みの行を除き、既存ユーザーはユーザー名でまとめて問い合わせる
+            keys = (valid.index + 1).astype(str) + ":" + valid["email"]
+            pending = pd.Series([not journal.completed(key) for key in keys], index=valid.index, dtype=bool)
+            resolver.prefetch_usernames(valid.loc[pending, "username"])
+
+            # チームとチャンネルは (チーム名, チャンネル名) の組ごとに一度だけ問い合わせる
+            resolved = resolve_targets(client, cache, valid[pending], args.concurrency)
+            rows = list(zip(resolved.index + 1, resolved.to_dict("records")))
+
+            # 各ユーザーを作成してチームに追加し、チャンネルへの追加はチャンネルごとにまとめて行う
+            # （apply_batch_rows 行ごとに追加してジャーナルに記録し、中断時にやり直す行を抑える）
+            results = []
+            batch_rows = config.get("apply_batch_rows", 1000)
+            for start in range(0, len(rows), batch_rows):
+                batch = rows[start : start + batch_rows]
+                if args.use_async:
+                    batch_results = asyncio.run(
+                        register_rows_async(config, cache, resolver, batch, async_concurrency)
+                    )
+                else:
+                    batch_results = register_rows(client, cache, resolver, batch, args.concurrency)
+                add_pending_channels(applier, batch_results, args.concurrency)
+                for result in batch_results:
+                    journal.record(journal_key(result["row"], result), result["channel"] == "added", result)
+                results += batch_results
+
+            # 完了済みの行はジャーナルの結果を表示する
+            if args.concurrency > 1 or args.use_async:
+                skipped = [journal.completed(key) for key in keys[~pending]]
+                print_summary(sorted(skipped + results, key=lambda result: result["row"]))
+    finally:
+        journal.close()
+        cache.save()
+
+    if validator.rejected_count:
+        print(f"検証で除外した行: {validator.rejected_count} 件 ({rejected_file})")
+    print(journal.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import os  # ファイルを扱うためのライブラリ
+import numpy as np  # 列単位で条件を組み合わせるためのライブラリ
+import pandas as pd  # CSVファイルをまとめて検証するためのライブラリ
+from typing import Iterator, List, Set, Tuple
+
+# 登録用CSVの必須の列です。
+REQUIRED_COLUMNS = ["email", "username", "password", "first_name", "last_name", "team_name", "channel_name"]
+
+# メールアドレスとユーザー名の形式です（ユーザー名は Mattermost の規則に合わせ、英小文字で始まる 3〜22 文字）。
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+USERNAME_PATTERN = r"^[a-z][a-z0-9._-]{2,21}$"
+
+
+def read_chunks(path: str, chunksize: int = 50000) -> Iterator[pd.DataFrame]:
+    """CSVを chunksize 行ずつ読み込みます。すべての列を文字列として読み、空欄は空文字列にします。
+
+    各チャンクのインデックスはファイル全体での行番号（0 始まり）です。
+    """
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize)
+    for chunk in reader:
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"CSVファイルに必須の列がありません: {', '.join(missing)}")
+        yield chunk
+
+
+class RegistrationValidator:
+    """登録用CSVをチャンク単位で検証し、重複を取り除きます。
+
+    必須項目の空欄、メールアドレスとユーザー名の形式、メールアドレスとユーザー名の重複を
+    列単位の演算でまとめて判定します。重複はファイル全体で判定し、最初の行だけを残します。
+    除外した行は理由を付けて rejected に返し、API は呼び出しません。
+    """
+
+    def __init__(self) -> None:
+        self.seen_emails: Set[str] = set()
+        self.seen_usernames: Set[str] = set()
+        self.valid_count = 0
+        self.rejected_count = 0
+
+    def validate(self, chunk: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """(登録する行, 除外する行) を返します。除外する行には reason 列を付けます。"""
+        chunk = chunk.copy()
+        for column in REQUIRED_COLUMNS:
+            chunk[column] = chunk[column].str.strip()
+        # Mattermost はメールアドレスとユーザー名を小文字で保存するため、比較の前にそろえます。
+        chunk["email"] = chunk["email"].str.lower()
+        chunk["username"] = chunk["username"].str.lower()
+
+        empty = chunk[REQUIRED_COLUMNS].eq("")
+        empty_columns = pd.Series("", index=chunk.index)
+        for column in REQUIRED_COLUMNS:
+            empty_columns += np.where(empty[column], column + ",", "")
+        reason = pd.Series("", index=chunk.index)
+        reason = reason.mask(empty.any(axis=1), "必須項目が空です: " + empty_columns.str.rstrip(","))
+        reason = reason.mask(
+            (reason == "") & ~chunk["email"].str.match(EMAIL_PATTERN), "メールアドレスの形式が正しくありません"
+        )
+        reason = reason.mask(
+            (reason == "") & ~chunk["username"].str.match(USERNAME_PATTERN), "ユーザー名の形式が正しくありません"
+        )
+
+        # 前のチャンクまでに現れたもの、またはこのチャンクの前の行と重複するものを除外します。
+        candidates = reason == ""
+        duplicate_email = chunk["email"].isin(self.seen_emails) | (
+            candidates & chunk["email"].where(candidates).duplicated()
+        )
+        reason = reason.mask(candidates & duplicate_email, "メールアドレスが重複しています")
+        candidates = reason == ""
+        duplicate_username = chunk["username"].isin(self.seen_usernames) | (
+            candidates & chunk["username"].where(candidates).duplicated()
+        )
+        reason = reason.mask(candidates & duplicate_username, "ユーザー名が重複しています")
+
+        valid = chunk[reason == ""]
+        rejected = chunk[reason != ""].assign(reason=reason[reason != ""])
+        self.seen_emails.update(valid["email"])
+        self.seen_usernames.update(valid["username"])
+        self.valid_count += len(valid)
+        self.rejected_count += len(rejected)
+        return valid, rejected
+
+
+def distinct_targets(valid: pd.DataFrame) -> List[Tuple[str, str]]:
+    """登録先の (チーム名, チャンネル名) の組を、重複を除いて返します。"""
+    pairs = valid[["team_name", "channel_name"]].drop_duplicates()
+    return list(pairs.itertuples(index=False, name=None))
+
+
+def write_rejected(path: str, rejected: pd.DataFrame, first: bool) -> None:
+    """除外した行を、ファイル全体での行番号と理由を付けて CSV に追記します。パスワードは書き出しません。"""
+    if first and os.path.exists(path):
+        os.remove(path)
+    if rejected.empty:
+        return
+    rejected.drop(columns=["password"]).assign(row=rejected.index + 1).to_csv(
+        path, mode="a", header=not os.path.exists(path), index=False, encoding="utf-8"
+    )
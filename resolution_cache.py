@@ -0,0 +1,156 @@
+import asyncio  # 非同期版の取得を一度にまとめるためのライブラリ
+import json  # JSON形式のデータを扱うためのライブラリ
+import os
+import threading  # 複数スレッドからの同時利用に備えるためのライブラリ
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from mattermost_api import MattermostClient  # 共有の Mattermost API クライアント
+
+
+class ResolutionCache:
+    """チーム名やチャンネル名から ID への対応を保持するキャッシュです。
+
+    値は種類（"team"、"channel" など）とキーの組で保存し、ttl 秒を過ぎたものは
+    再取得します。path を指定すると JSON ファイルに保存し、次回の実行でも使います。
+    見つからなかった名前（None）は保存しません。
+
+    同じファイルを別のサーバー（検証環境と本番環境など）で使っても他のサーバーの ID を返さないよう、
+    値は scope（サーバーの URL）ごとに分けて保存し、scope の値だけを参照します。
+    """
+
+    def __init__(self, ttl: float = 3600, path: Optional[str] = None, scope: str = "") -> None:
+        self.ttl = ttl
+        self.path = path
+        self.scope = scope
+        self._servers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                # サーバーごとに分けていない以前の形式のファイルは、どのサーバーの値か分からないため使いません。
+                if isinstance(data, dict) and isinstance(data.get("servers"), dict):
+                    self._servers = data["servers"]
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"キャッシュファイルの読み込みに失敗しました: {e}")
+        self._entries = self._servers.setdefault(scope, {})
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ResolutionCache":
+        return cls(ttl=config.get("cache_ttl", 3600), path=config.get("cache_file"), scope=config["url"].rstrip("/"))
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(kind, {}).get(key)
+        if entry is None or time.time() - entry["stored_at"] > self.ttl:
+            return None
+        return entry["value"]
+
+    def set(self, kind: str, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries.setdefault(kind, {})[key] = {"value": value, "stored_at": time.time()}
+
+    def get_or_resolve(self, kind: str, key: str, resolve: Callable[[], Optional[Any]]) -> Optional[Any]:
+        # 同じキーを複数のスレッドが同時に取得しないよう、キーごとにロックします。
+        with self._lock:
+            key_lock = self._key_locks.setdefault(f"{kind}\0{key}", threading.Lock())
+        with key_lock:
+            value = self.get(kind, key)
+            if value is None:
+                value = resolve()
+                if value is not None:
+                    self.set(kind, key, value)
+            return value
+
+    async def get_or_resolve_async(
+        self, kind: str, key: str, resolve: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        # get_or_resolve の非同期版です。同じキーの取得は 1 つのタスクにまとめます。
+        value = self.get(kind, key)
+        if value is not None:
+            return value
+        task_key = f"{kind}\0{key}"
+        if task_key not in self._tasks:
+            self._tasks[task_key] = asyncio.ensure_future(resolve())
+        value = await self._tasks[task_key]
+        if value is not None:
+            self.set(kind, key, value)
+        return value
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"servers": self._servers}, ensure_ascii=False)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+
+class UserResolver:
+    """ユーザー名・メールアドレスからユーザーIDへの対応を一括で取得し、実行中保持します。
+
+    ユーザー名は POST /users/usernames で chunk_size 件ずつまとめて問い合わせます。
+    メールアドレスを一括で引く API はないため、ユーザー名の一括取得で見つからなかった
+    メールアドレスだけを GET /users/email/{email} で個別に問い合わせます。
+    """
+
+    def __init__(self, client: MattermostClient, chunk_size: int = 100) -> None:
+        self.client = client
+        self.chunk_size = chunk_size
+        self._by_username: Dict[str, Optional[str]] = {}
+        self._by_email: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, users: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for user in users:
+                self._by_username[user["username"]] = user["id"]
+                if user.get("email"):
+                    self._by_email[user["email"].lower()] = user["id"]
+
+    def _fetch_in_chunks(self, path: str, keys: List[str]) -> None:
+        for start in range(0, len(keys), self.chunk_size):
+            response = self.client.post(path, json=keys[start : start + self.chunk_size])
+            response.raise_for_status()
+            self._store(response.json())
+
+    def prefetch_usernames(self, usernames: Iterable[str]) -> None:
+        with self._lock:
+            missing = list(dict.fromkeys(u for u in usernames if u and u not in self._by_username))
+        self._fetch_in_chunks("/users/usernames", missing)
+        # 見つからなかったユーザー名も記録し、再度問い合わせないようにします。
+        with self._lock:
+            for username in missing:
+                self._by_username.setdefault(username, None)
+
+    def id_for_username(self, username: str) -> Optional[str]:
+        if username not in self._by_username:
+            self.prefetch_usernames([username])
+        return self._by_username.get(username)
+
+    def cached_email(self, email: str) -> Tuple[bool, Optional[str]]:
+        """問い合わせ済みかどうかと、メールアドレスのユーザーIDを返します。サーバーには問い合わせません。"""
+        with self._lock:
+            key = email.lower()
+            return key in self._by_email, self._by_email.get(key)
+
+    def id_for_email(self, email: str) -> Optional[str]:
+        key = email.lower()
+        with self._lock:
+            if key in self._by_email:
+                return self._by_email[key]
+
+        response = self.client.get(f"/users/email/{email}")
+        if response.status_code == 200:
+            self._store([response.json()])
+        elif response.status_code != 404:
+            response.raise_for_status()
+        with self._lock:
+            return self._by_email.setdefault(key, None)
+
+    def add(self, user: Dict[str, Any]) -> None:
+        # 新規作成したユーザーを登録し、「見つからない」という記録を上書きします。
+        self._store([user])
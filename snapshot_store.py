@@ -0,0 +1,173 @@
+import sqlite3  # ローカルのスナップショットを保存するためのライブラリ
+from pathlib import Path  # 読み取り専用で開くファイルの URI を作るためのライブラリ
+from datetime import datetime  # 日時を扱うためのライブラリ
+from typing import Optional
+from membership_snapshot import MembershipSnapshot  # チャンネル単位で参加状況を一括取得するエンジン
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS teams (
+    id TEXT PRIMARY KEY,
+    display_name TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    id TEXT PRIMARY KEY,
+    team_id TEXT NOT NULL,
+    display_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    update_at INTEGER NOT NULL,
+    last_post_at INTEGER NOT NULL,
+    member_count INTEGER,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    channel_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (channel_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SnapshotStore:
+    """ユーザー、チーム、チャンネル、参加状況を SQLite に保存するローカルのスナップショットです。
+
+    保存時は、今回メンバー一覧を取得し直したチャンネルの参加状況だけを書き換えます。
+    読み込んだスナップショットを MembershipSnapshot.build に渡すと、
+    update_at、last_post_at、member_count のいずれかが変わったチャンネルだけをサーバーから取得します。
+    """
+
+    def __init__(self, path: str, readonly: bool = False) -> None:
+        """readonly が True の場合は、既存のファイルを読み取り専用で開きます。
+
+        ファイルを作成・変更しないため、ファイルがない場合や SQLite のファイルでない場合は sqlite3.Error を送出します。
+        """
+        self.path = path
+        if readonly:
+            self.connection = sqlite3.connect(Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+        else:
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(SCHEMA)
+        # member_count の列がない以前のファイルには列を追加します（NULL のチャンネルは次回取得し直します）。
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(channels)")}
+        self.has_member_count = "member_count" in columns
+        if not self.has_member_count and not readonly:
+            self.connection.execute("ALTER TABLE channels ADD COLUMN member_count INTEGER")
+            self.has_member_count = True
+
+    def refreshed_at(self) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'refreshed_at'").fetchone()
+        return row[0] if row else None
+
+    def full_refreshed_at(self) -> Optional[datetime]:
+        """全チャンネルのメンバー一覧を最後に取得した日時を返します。"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'full_refreshed_at'").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def load(self) -> Optional[MembershipSnapshot]:
+        """保存済みのスナップショットを返します。まだ保存されていない場合は None を返します。"""
+        if self.refreshed_at() is None:
+            return None
+
+        snapshot = MembershipSnapshot()
+        snapshot.users = dict(
+            self.connection.execute("SELECT id, username FROM users ORDER BY position")
+        )
+        snapshot.teams = [
+            {"id": team_id, "display_name": display_name}
+            for team_id, display_name in self.connection.execute(
+                "SELECT id, display_name FROM teams ORDER BY position"
+            )
+        ]
+        for channel_id, team_id, display_name, channel_type, update_at, last_post_at, member_count in self.connection.execute(
+            "SELECT id, team_id, display_name, type, update_at, last_post_at, "
+            + ("member_count" if self.has_member_count else "NULL")
+            + " FROM channels ORDER BY position"
+        ):
+            snapshot.channels.setdefault(team_id, []).append(
+                {
+                    "id": channel_id,
+                    "team_id": team_id,
+                    "display_name": display_name,
+                    "type": channel_type,
+                    "update_at": update_at,
+                    "last_post_at": last_post_at,
+                    "member_count": member_count,
+                }
+            )
+            snapshot.members[channel_id] = set()
+        for channel_id, user_id in self.connection.execute("SELECT channel_id, user_id FROM memberships"):
+            snapshot.members.setdefault(channel_id, set()).add(user_id)
+        return snapshot
+
+    def save(self, snapshot: MembershipSnapshot) -> None:
+        """スナップショットを保存します。参加状況は取得し直したチャンネルの分だけ書き換えます。"""
+        channels = [channel for team in snapshot.teams for channel in snapshot.channels.get(team["id"], [])]
+        channel_ids = {channel["id"] for channel in channels}
+
+        with self.connection:
+            # ユーザー、チーム、チャンネルの一覧は件数が少ないため、毎回入れ替えます。
+            self.connection.execute("DELETE FROM users")
+            self.connection.executemany(
+                "INSERT INTO users (id, username, position) VALUES (?, ?, ?)",
+                ((user_id, username, i) for i, (user_id, username) in enumerate(snapshot.users.items())),
+            )
+            self.connection.execute("DELETE FROM teams")
+            self.connection.executemany(
+                "INSERT INTO teams (id, display_name, position) VALUES (?, ?, ?)",
+                ((team["id"], team["display_name"], i) for i, team in enumerate(snapshot.teams)),
+            )
+            self.connection.execute("DELETE FROM channels")
+            self.connection.executemany(
+                "INSERT INTO channels (id, team_id, display_name, type, update_at, last_post_at, member_count, position)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        channel["id"],
+                        channel["team_id"],
+                        channel["display_name"],
+                        channel["type"],
+                        channel.get("update_at", 0),
+                        channel.get("last_post_at", 0),
+                        channel.get("member_count"),
+                        i,
+                    )
+                    for i, channel in enumerate(channels)
+                ),
+            )
+
+            # なくなったチャンネルと、取得し直したチャンネルの参加状況を入れ替えます。
+            stored_ids = {row[0] for row in self.connection.execute("SELECT DISTINCT channel_id FROM memberships")}
+            for channel_id in (stored_ids - channel_ids) | snapshot.refreshed_channels:
+                self.connection.execute("DELETE FROM memberships WHERE channel_id = ?", (channel_id,))
+            for channel_id in snapshot.refreshed_channels & channel_ids:
+                self.connection.executemany(
+                    "INSERT INTO memberships (channel_id, user_id) VALUES (?, ?)",
+                    ((channel_id, user_id) for user_id in snapshot.members[channel_id]),
+                )
+
+            now = datetime.now().isoformat(timespec="seconds")
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('refreshed_at', ?)", (now,))
+            if snapshot.full:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('full_refreshed_at', ?)", (now,)
+                )
+
+    def backup(self, path: str) -> None:
+        """スナップショットを別の SQLite ファイルに複製します。差分の比較用に過去の状態を残すために使います。"""
+        target = sqlite3.connect(path)
+        try:
+            self.connection.backup(target)
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        self.connection.close()